@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import math
+import pickle
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+# Finest grain of the cube; every table below is a roll-up of these cells
+DIMENSIONS = ["city", "district", "category_en", "sale_type"]
+
+MEASURES = ["price", "meter_price", "area_sqm", "price_per_sqm"]
+
+# Grouping sets emitted to the aggregates table
+GROUPINGS: list[tuple[str, ...]] = [
+    (),
+    ("sale_type",),
+    ("city",),
+    ("category_en",),
+    ("city", "sale_type"),
+    ("city", "category_en"),
+    ("city", "district"),
+    ("city", "district", "sale_type"),
+    ("city", "district", "category_en"),
+    ("city", "district", "category_en", "sale_type"),
+]
+
+QUANTILES = {"p10": 0.1, "p25": 0.25, "median": 0.5, "p75": 0.75, "p90": 0.9}
+
+# bucket key of zero (and negative) values, sorts before every real bucket
+ZERO_KEY = -(2**31)
+
+
+class AggregateCube:
+    """Mergeable per-cell sketches of the listing measures.
+
+    For every DIMENSIONS cell and measure the cube keeps the count and sum
+    of the values plus a log-bucketed histogram in the style of DDSketch:
+    value x > 0 falls into bucket ceil(log_gamma(x)), so any quantile read
+    from it is within `relative_accuracy` of an actual value. Histograms
+    merge by adding bucket counts, which makes roll-ups to coarser
+    groupings exact, and rows can be taken out again by subtracting their
+    counts, which is how incremental runs replace updated listings.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.buckets = pd.DataFrame(columns=[*DIMENSIONS, "measure", "key", "count"])
+        self.totals = pd.DataFrame(columns=[*DIMENSIONS, "measure", "count", "sum"])
+        self.rows = 0
+
+    def _measures(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Long (dimensions, measure, value) frame of the non-null measures."""
+        dims = df.reindex(columns=DIMENSIONS).astype(object)
+        dims = dims.where(dims.notna(), None)
+        values = df.reindex(columns=MEASURES[:-1]).astype(float)
+        area = values["area_sqm"].where(values["area_sqm"] > 0)
+        values["price_per_sqm"] = values["price"] / area
+        long = pd.concat([dims, values], axis=1).melt(
+            id_vars=DIMENSIONS, value_vars=MEASURES, var_name="measure"
+        )
+        return long[long["value"].notna() & np.isfinite(long["value"])]
+
+    def _keys(self, values: pd.Series) -> np.ndarray:
+        positive = values.to_numpy() > 0
+        keys = np.full(len(values), ZERO_KEY, dtype=np.int64)
+        keys[positive] = np.ceil(
+            np.log(values.to_numpy()[positive]) / math.log(self.gamma)
+        ).astype(np.int64)
+        return keys
+
+    def bucket_value(self, keys: np.ndarray) -> np.ndarray:
+        """Representative value of buckets (relative error <= accuracy)."""
+        keys = np.asarray(keys, dtype=np.int64)
+        values = 2 * self.gamma ** keys.astype(float) / (self.gamma + 1)
+        return np.where(keys == ZERO_KEY, 0.0, values)
+
+    def _update(self, df: pd.DataFrame, sign: int) -> None:
+        long = self._measures(df)
+        long = long.assign(key=self._keys(long["value"]))
+        cell = [*DIMENSIONS, "measure"]
+        buckets = (
+            long.groupby([*cell, "key"], dropna=False).size().rename("count") * sign
+        ).reset_index()
+        totals = long.groupby(cell, dropna=False)["value"].agg(["size", "sum"])
+        totals = (
+            (totals.rename(columns={"size": "count"}) * sign)
+            .reset_index()
+            .astype({"count": "int64"})
+        )
+        self.buckets = _sum_counts(self.buckets, buckets, [*cell, "key"])
+        self.totals = _sum_counts(self.totals, totals, cell)
+        self.rows += sign * len(df)
+
+    def add(self, df: pd.DataFrame) -> None:
+        """Add the listings of a cleaned frame."""
+        self._update(df, 1)
+
+    def remove(self, df: pd.DataFrame) -> None:
+        """Take out listings previously added (e.g. older versions)."""
+        self._update(df, -1)
+
+    def table(
+        self,
+        groupings: list[tuple[str, ...]] = GROUPINGS,
+        quantiles: dict[str, float] = QUANTILES,
+    ) -> pd.DataFrame:
+        """Count, mean and quantiles of every measure per grouping set.
+
+        Dimensions not in a row's `grouping` are rolled up and left empty.
+        """
+        # integer codes per column, shared by totals and buckets (NaN -> -1)
+        totals_codes, bucket_codes, sizes = {}, {}, {}
+        for column in [*DIMENSIONS, "measure"]:
+            codes, uniques = pd.factorize(self.totals[column])
+            totals_codes[column] = codes
+            bucket_codes[column] = pd.Categorical(
+                self.buckets[column], categories=uniques
+            ).codes
+            sizes[column] = len(uniques) + 1
+        counts = self.totals["count"].to_numpy()
+        sums = self.totals["sum"].to_numpy(dtype=float)
+        bucket_counts = self.buckets["count"].to_numpy()
+        bucket_keys = self.buckets["key"].to_numpy()
+
+        tables = []
+        for grouping in groupings:
+            group = [*grouping, "measure"]
+            groups, first_rows, totals_group = np.unique(
+                _cell_ids(totals_codes, sizes, group),
+                return_index=True,
+                return_inverse=True,
+            )
+            stats = self.totals.iloc[first_rows][group].reset_index(drop=True)
+            total = np.bincount(totals_group, weights=counts, minlength=len(groups))
+            stats["count"] = total.astype(np.int64)
+            stats["mean"] = (
+                np.bincount(totals_group, weights=sums, minlength=len(groups)) / total
+            )
+
+            # buckets ordered by group, then key; seen = running count per group
+            bucket_group = np.searchsorted(
+                groups, _cell_ids(bucket_codes, sizes, group)
+            )
+            order = np.lexsort((bucket_keys, bucket_group))
+            sorted_group = bucket_group[order]
+            sorted_counts = bucket_counts[order]
+            running = np.cumsum(sorted_counts)
+            group_start = np.searchsorted(sorted_group, sorted_group)
+            seen = running - running[group_start] + sorted_counts[group_start]
+            for name, q in quantiles.items():
+                # first bucket past the q-th rank, as in DDSketch
+                reached = np.flatnonzero(seen > q * (total[sorted_group] - 1))
+                _, first = np.unique(sorted_group[reached], return_index=True)
+                stats[name] = self.bucket_value(bucket_keys[order][reached[first]])
+            stats.insert(0, "grouping", ",".join(grouping) or "all")
+            tables.append(stats)
+        return pd.concat(tables, ignore_index=True).reindex(
+            columns=["grouping", *DIMENSIONS, "measure", "count", "mean", *quantiles]
+        )
+
+    def save(self, path: Path) -> Path:
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> AggregateCube:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def _sum_counts(
+    current: pd.DataFrame, delta: pd.DataFrame, keys: list[str]
+) -> pd.DataFrame:
+    """Add `delta` to `current` by key, dropping cells that reach zero."""
+    if current.empty:
+        combined = delta
+    else:
+        combined = (
+            pd.concat([current, delta], ignore_index=True)
+            .groupby(keys, dropna=False, sort=False)
+            .sum()
+            .reset_index()
+        )
+    return combined[combined["count"] != 0].reset_index(drop=True)
+
+
+def _cell_ids(
+    codes: dict[str, np.ndarray], sizes: dict[str, int], columns: list[str]
+) -> np.ndarray:
+    """One int64 per row combining the codes of `columns` (mixed radix)."""
+    ids = np.zeros(len(codes[columns[0]]), dtype=np.int64)
+    for column in columns:
+        ids = ids * sizes[column] + (codes[column] + 1)
+    return ids
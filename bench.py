@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+
+import clean_data
+import main
+from corpus import write_corpus
+from schema import conform_listings
+from sessions import SessionPool
+from standin import StandInServer
+
+external_dir = Path("./data/external")
+bench_dir = Path("./data/bench")
+
+# name -> setup function returning the callable to time
+BENCHMARKS: dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup: Callable[[], Callable[[], object]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def read_fixture(name: str) -> str:
+    return (external_dir / name).read_text(encoding="utf-8")
+
+
+@benchmark("parse_using_json")
+def bench_parse_using_json():
+    page = read_fixture("category1.html")
+    return lambda: main.parse_using_json(page)
+
+
+@benchmark("parse_category_page")
+def bench_parse_category_page():
+    page = read_fixture("category1.html")
+    return lambda: main.parse_category_page(page)
+
+
+@benchmark("get_category_details")
+def bench_get_category_details():
+    keys = [str(key) for key in range(0, 110)]
+    return lambda: [main.get_category_details(key) for key in keys]
+
+
+@benchmark("flatten_dict")
+def bench_flatten_dict():
+    state = json.loads(read_fixture("category1.json"))["props"]["pageProps"][
+        "__APOLLO_STATE__"
+    ]
+    listings = [
+        value for key, value in state.items() if key.startswith("ElasticWebListing:")
+    ]
+    return lambda: [main.flatten_dict(listing) for listing in listings]
+
+
+@benchmark("clean_dataframe")
+def bench_clean_dataframe():
+    pages = [read_fixture("category1.html"), read_fixture("category2.html")]
+    df = conform_listings(
+        main.build_listings_frame(main.parse_all_category_pages(pages, use_cache=False))
+    )
+    df = pd.concat([df] * 25, ignore_index=True)
+    return lambda: clean_data.clean_dataframe(df)
+
+
+@benchmark("parse_corpus")
+def bench_parse_corpus():
+    pages = [read_fixture(name) for name in ["category1.html", "category2.html"] * 10]
+    path = write_corpus(pages, bench_dir / "pages.corpus")
+    return lambda: main.build_listings_frame(
+        main.parse_page_corpus(path, use_cache=False)
+    )
+
+
+@benchmark("parse_cached")
+def bench_parse_cached():
+    pages = [read_fixture(name) for name in ["category1.html", "category2.html"] * 10]
+    # the warm-up call fills the parse cache, timed calls are all hits
+    return lambda: main.parse_all_category_pages(pages)
+
+
+@benchmark("end_to_end")
+def bench_end_to_end():
+    pages = [
+        (external_dir / name).read_bytes()
+        for name in ["category1.html", "category2.html"] * 10
+    ]
+    main.init()
+    # one session without a request budget, so the fetches are not throttled
+    main.session_pool = SessionPool([{}], main.REQUEST_HEADERS, rate=None)
+
+    def run():
+        with StandInServer(pages) as server:
+            main.STOP_PAGE = float("inf")
+            # uncached fetches: the page cache would turn this into a no-op
+            with contextlib.redirect_stdout(io.StringIO()):
+                html_pages = main.get_all_category_pages(
+                    server.url + "listings/",
+                    fetch=partial(main.fetch_data, use_cache=False),
+                )
+            main.build_listings_frame(
+                main.parse_all_category_pages(html_pages, use_cache=False)
+            )
+
+    return run
+
+
+def bench_import(module: str):
+    # a fresh interpreter per call: what a short-lived worker process pays
+    command = [sys.executable, "-c", f"import {module}"]
+    return lambda: subprocess.run(command, check=True)
+
+
+@benchmark("import_main")
+def bench_import_main():
+    return bench_import("main")
+
+
+@benchmark("import_clean_data")
+def bench_import_clean_data():
+    return bench_import("clean_data")
+
+
+def time_callable(
+    fn: Callable[[], object], repeats: int, min_time: float
+) -> dict[str, float | int]:
+    """Per-call timings: each repeat loops until it has run for `min_time`."""
+    fn()  # warm up caches and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    timings = [elapsed / number]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "number": number,
+        "repeats": repeats,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Benchmarks whose median got slower than the baseline by > threshold."""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base:
+            continue
+        ratio = result["median_s"] / base["median_s"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {base['median_s']:.6f}s -> {result['median_s']:.6f}s "
+                f"({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def run(names: list[str], repeats: int, min_time: float) -> dict:
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": {},
+    }
+    for name in names:
+        timing = time_callable(BENCHMARKS[name](), repeats, min_time)
+        results["benchmarks"][name] = timing
+        print(f"{name:<24} {timing['median_s'] * 1000:10.3f} ms/call")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks")
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"any of {', '.join(BENCHMARKS)} (default: all)"
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--output", type=Path, default=bench_dir / "results.json")
+    parser.add_argument("--baseline", type=Path, default=bench_dir / "baseline.json")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed slowdown against the baseline before failing (0.25 = 25%%)",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the new baseline",
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {unknown}")
+
+    results = run(args.benchmarks or list(BENCHMARKS), args.repeats, args.min_time)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2, sort_keys=True))
+    print(f"Results saved to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline.exists():
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.threshold
+        )
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
@@ -1,15 +1,50 @@
-import pandas as pd
+from __future__ import annotations
+
+import argparse
 import json
 import re
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from pathlib import Path
+from lazy import lazy_import
+from schema import CsvEngine, read_listings_csv
+from aggregates import AggregateCube
+from dedupe_index import DedupeIndex
+from geo_index import GeoIndex
+from listing_store import ListingStore
+from near_duplicates import (
+    BANDS,
+    ROWS_PER_BAND,
+    listing_signatures,
+    near_duplicate_clusters,
+)
+from profiling import profile_run, stage
+from sinks import SINK_SUFFIXES, Sink, SinkFormat, write_frame, write_sinks
+from text_index import TextIndex, default_text_index_path
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
 
 data_dir = Path("./data")
 raw_dir = data_dir / "raw"
 processed_dir = data_dir / "processed"
 output_dir = data_dir / "output"
-processed_dir.mkdir(parents=True, exist_ok=True)
-output_dir.mkdir(parents=True, exist_ok=True)
+
+# Cleaned dataset plus raw row keys and hashes, kept between runs so that
+# --incremental only has to clean new or changed rows
+cleaned_state_path = processed_dir / "aqar_fm_listings_cleaned.pkl"
+# columns of the state that are not written to the cleaned outputs; _minhash
+# holds each row's near-duplicate signature, computed once per version
+STATE_COLUMNS = ["_key", "_raw_hash", "_minhash"]
+# Grid index over the cleaned listings' coordinates, see geo_index.py
+geo_index_path = processed_dir / "aqar_fm_listings_geo.npz"
+# Quantile sketches per city/district/category/sale type, updated in place
+# by --incremental, and the aggregate table computed from them
+aggregates_state_path = processed_dir / "aqar_fm_listings_aggregates.pkl"
+aggregates_path = output_dir / "aqar_fm_listings_aggregates.csv"
 
 
 def clean_price(price: Any) -> float | None:
@@ -145,7 +180,8 @@ def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     ]
     for col in price_columns:
         if col in df_cleaned.columns:
-            df_cleaned[col] = df_cleaned[col].apply(clean_price)
+            with stage(f"clean_price:{col}"):
+                df_cleaned[col] = df_cleaned[col].apply(clean_price)
 
     # Numeric columns
     numeric_columns = [
@@ -164,7 +200,8 @@ def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     ]
     for col in numeric_columns:
         if col in df_cleaned.columns:
-            df_cleaned[col] = df_cleaned[col].apply(clean_numeric)
+            with stage(f"clean_numeric:{col}"):
+                df_cleaned[col] = df_cleaned[col].apply(clean_numeric)
 
     # Boolean columns
     boolean_columns = [
@@ -204,7 +241,8 @@ def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     ]
     for col in boolean_columns:
         if col in df_cleaned.columns:
-            df_cleaned[col] = df_cleaned[col].apply(clean_boolean)
+            with stage(f"clean_boolean:{col}"):
+                df_cleaned[col] = df_cleaned[col].apply(clean_boolean)
 
     # Text columns
     text_columns = [
@@ -235,25 +273,35 @@ def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     ]
     for col in text_columns:
         if col in df_cleaned.columns:
-            df_cleaned[col] = df_cleaned[col].apply(clean_text)
+            with stage(f"clean_text:{col}"):
+                df_cleaned[col] = df_cleaned[col].apply(clean_text)
 
     # Timestamp columns - keep as is but ensure proper format
     timestamp_columns = ["create_time", "published_at", "last_update"]
     for col in timestamp_columns:
         if col in df_cleaned.columns:
-            df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors="coerce")
+            with stage(f"to_numeric:{col}"):
+                df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors="coerce")
 
     # List columns
     list_columns = ["images", "videos"]
     for col in list_columns:
         if col in df_cleaned.columns:
-            df_cleaned[col] = df_cleaned[col].apply(clean_list_field)
+            with stage(f"clean_list_field:{col}"):
+                df_cleaned[col] = df_cleaned[col].apply(clean_list_field)
 
     return df_cleaned
 
 
-def remove_duplicates(df: pd.DataFrame) -> pd.DataFrame:
-    """Remove duplicate listings based on ID or URL."""
+def remove_duplicates(
+    df: pd.DataFrame, index: DedupeIndex | None = None
+) -> pd.DataFrame:
+    """Remove duplicate listings based on ID or URL.
+
+    With an `index`, listings already processed in a previous run are
+    removed as well: same id and the same content (`_raw_hash`, when the
+    frame has it), or an older last_update.
+    """
     # Remove duplicates based on ID if available
     if "id" in df.columns:
         df = df.drop_duplicates(subset=["id"], keep="first")
@@ -261,6 +309,14 @@ def remove_duplicates(df: pd.DataFrame) -> pd.DataFrame:
     elif "url" in df.columns:
         df = df.drop_duplicates(subset=["url"], keep="first")
 
+    if index and "id" in df.columns and "last_update" in df.columns:
+        digests = df["_raw_hash"] if "_raw_hash" in df.columns else None
+        if digests is None:
+            seen = index.unchanged(zip(df["id"], df["last_update"]))
+        else:
+            seen = index.unchanged(zip(df["id"], df["last_update"], digests))
+        df = df[~df["id"].isin(seen)]
+
     return df
 
 
@@ -269,97 +325,283 @@ def remove_diacritics(text: str) -> str:
     return re.sub(r"[\u064B-\u0652\u0670]", "", text)
 
 
-def split_datasets(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    rental_df = df[df["sale_type"] == "rent"]
-    auction_df = df[df["sale_type"] == "auction"]
-    sale_df = df[df["sale_type"] == "sale"]
-    return rental_df, auction_df, sale_df
+def listing_keys(df: pd.DataFrame) -> pd.Series:
+    """Upsert key of each raw row: the listing id, or the URL when it has none."""
+    keys = pd.Series(pd.NA, index=df.index, dtype="string")
+    if "id" in df.columns:
+        keys = df["id"].astype("string")
+    if "url" in df.columns:
+        keys = keys.fillna(df["url"].astype("string"))
+    return keys
+
+
+def raw_row_hashes(df: pd.DataFrame) -> pd.Series:
+    """Content hash of each raw row, used to tell changed listings apart."""
+    return pd.util.hash_pandas_object(df, index=False)
 
 
-def main():
-    """Main cleaning process."""
+def load_cleaned_state() -> pd.DataFrame | None:
+    """The previously cleaned dataset with its `_key`/`_raw_hash` columns."""
+    if not cleaned_state_path.exists():
+        return None
+    return pd.read_pickle(cleaned_state_path)
+
+
+def select_changed(df: pd.DataFrame, state: pd.DataFrame) -> pd.DataFrame:
+    """Raw rows whose key is new or whose content hash differs from the state."""
+    known = pd.MultiIndex.from_arrays([state["_key"], state["_raw_hash"]])
+    current = pd.MultiIndex.from_arrays([df["_key"], df["_raw_hash"]])
+    return df[~current.isin(known)]
+
+
+def upsert_cleaned(state: pd.DataFrame, updates: pd.DataFrame) -> pd.DataFrame:
+    """Replace rows of `state` that share a key with `updates`, append the rest."""
+    kept = state[~state["_key"].isin(updates["_key"])]
+    if kept.empty:
+        return updates.reset_index(drop=True)
+    return pd.concat([kept, updates], ignore_index=True)
+
+
+def cluster_near_duplicates(df_state: pd.DataFrame) -> None:
+    """Set `duplicate_cluster` on the cleaned state, in place.
+
+    Only rows without a stored `_minhash` signature (new or changed
+    listings, or a state from before signatures were kept) are signed;
+    the clustering itself still runs over every row.
+    """
+    if "_minhash" not in df_state.columns:
+        df_state["_minhash"] = None
+    width = BANDS * ROWS_PER_BAND
+    stored = df_state["_minhash"].astype(object)
+    missing = ~stored.map(lambda s: isinstance(s, bytes) and len(s) == width * 4)
+    if missing.any():
+        signed = listing_signatures(df_state[missing])
+        stored[missing] = [row.tobytes() for row in signed]
+        df_state["_minhash"] = stored
+    signatures = np.frombuffer(b"".join(stored), dtype=np.uint32)
+    df_state["duplicate_cluster"] = near_duplicate_clusters(
+        df_state, signatures.reshape(len(df_state), width)
+    )
+
+
+def output_sinks(json_format: SinkFormat = "json") -> list[Sink]:
+    """The cleaned full dataset plus one file per sale type, as CSV and JSON."""
+    sinks = []
+    for directory, name, sale_type in [
+        (processed_dir, "aqar_fm_listings_cleaned", None),
+        (output_dir, "aqar_fm_listings_rental_cleaned", "rent"),
+        (output_dir, "aqar_fm_listings_auction_cleaned", "auction"),
+        (output_dir, "aqar_fm_listings_sale_cleaned", "sale"),
+    ]:
+        for format in ("csv", json_format):
+            path = directory / (name + SINK_SUFFIXES[format])
+            sinks.append(Sink(path, format, sale_type))
+    return sinks
+
+
+def update_aggregates(
+    df_state: pd.DataFrame,
+    replaced: pd.DataFrame | None = None,
+    updates: pd.DataFrame | None = None,
+) -> AggregateCube:
+    """Bring the saved aggregate sketches in line with the cleaned dataset.
+
+    With `replaced`/`updates` from an incremental run, the old versions are
+    subtracted and the new ones added; otherwise, or if the saved sketches
+    do not match the dataset, they are rebuilt from `df_state`.
+    """
+    cube = None
+    if updates is not None and aggregates_state_path.exists():
+        cube = AggregateCube.load(aggregates_state_path)
+        cube.remove(replaced)
+        cube.add(updates)
+    if cube is None or cube.rows != len(df_state):
+        cube = AggregateCube()
+        cube.add(df_state)
+    cube.save(aggregates_state_path)
+    return cube
+
+
+def main(
+    engine: CsvEngine | None = None,
+    json_format: SinkFormat = "json",
+    incremental: bool = False,
+    store: bool = False,
+    delta: bool = False,
+):
+    """Main cleaning process.
+
+    With `delta`, the scraper's delta file (the listings a --skip-unchanged
+    or --revisit run found) is cleaned into the previous cleaned state; it
+    is never taken for the whole dataset.
+    """
     print("Starting data cleaning process...")
+    processed_dir.mkdir(parents=True, exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
 
     # Load the data
+    raw_path = raw_dir / (
+        "aqar_fm_listings.delta.csv" if delta else "aqar_fm_listings.csv"
+    )
+    state = load_cleaned_state() if incremental else None
+    if delta and state is None:
+        raise ValueError(
+            f"{raw_path} only holds new or changed listings: it needs "
+            "--incremental and the cleaned state of an earlier full run"
+        )
     print("Loading data from CSV...")
-    df = pd.read_csv(raw_dir / "aqar_fm_listings.csv")
+    with stage("read"):
+        df = read_listings_csv(raw_path, engine=engine)
 
     print(f"Loaded {len(df)} records")
     print(f"Columns: {df.columns.tolist()}")
 
     # Remove duplicates
+    df = df.assign(_key=listing_keys(df), _raw_hash=raw_row_hashes(df))
     print("\nRemoving duplicates...")
-    df = remove_duplicates(df)
+    # the index only tells what is already in the state, so it is
+    # consulted only when there is a state to merge into
+    index = DedupeIndex("cleaner")
+    with stage("remove_duplicates"):
+        df = remove_duplicates(df, index if state is not None else None)
     print(f"Records after removing duplicates: {len(df)}")
 
-    # Clean the data
-    print("\nCleaning data...")
-    df_cleaned = clean_dataframe(df)
+    sinks = output_sinks(json_format)
+
+    if state is not None:
+        print("\nSelecting new or changed records...")
+        changed = select_changed(df, state)
+        print(f"New or changed records: {len(changed)}")
+
+        print("\nCleaning data...")
+        updates = clean_dataframe(changed)
+        df_state = upsert_cleaned(state, updates)
+
+        print("\nClustering near-duplicate listings...")
+        with stage("near duplicates"):
+            cluster_near_duplicates(df_state)
+
+        # Only sale types that gained or lost rows, or whose rows joined or
+        # left a cluster, need their files rewritten
+        replaced = state[state["_key"].isin(updates["_key"])]
+        touched = set(updates["sale_type"]) | set(replaced["sale_type"])
+        if "duplicate_cluster" in state.columns:
+            previous = df_state["_key"].map(
+                state.set_index("_key")["duplicate_cluster"]
+            )
+            moved = df_state["duplicate_cluster"].ne(previous).fillna(True)
+            touched |= set(df_state.loc[moved, "sale_type"])
+        sinks = [
+            sink
+            for sink in sinks
+            if sink.sale_type is None or sink.sale_type in touched
+        ]
+    else:
+        print("\nCleaning data...")
+        df_state = clean_dataframe(df)
+        replaced = updates = None
+
+        print("\nClustering near-duplicate listings...")
+        with stage("near duplicates"):
+            cluster_near_duplicates(df_state)
+
+    with stage("aggregates"):
+        cube = update_aggregates(df_state, replaced, updates)
+
+    df_state.to_pickle(cleaned_state_path)
+    df_cleaned = df_state.drop(columns=STATE_COLUMNS)
 
     # Show some statistics
     print("\nData cleaning summary:")
     print(f"Total records: {len(df_cleaned)}")
+    reposts = df_cleaned["duplicate_cluster"] != pd.to_numeric(df_cleaned["id"])
+    print(f"Near-duplicate reposts: {reposts.sum()}")
     print(f"Null values per column:")
     print(df_cleaned.isnull().sum())
 
     # Save cleaned data
     print("\nSaving cleaned data...")
-    df_cleaned.to_csv(
-        processed_dir / "aqar_fm_listings_cleaned.csv", index=False, lineterminator="\n"
-    )
-    df_cleaned.to_json(
-        processed_dir / "aqar_fm_listings_cleaned.json",
-        orient="records",
-        force_ascii=False,
-        indent=2,
-    )
+    with stage("write"):
+        written = write_sinks(df_cleaned, sinks)
+    with stage("geo index"):
+        written.append(GeoIndex.build(df_cleaned).save(geo_index_path))
+    with stage("aggregates"):
+        written.append(write_frame(cube.table(), aggregates_path, "csv"))
+    with stage("text index"):
+        # full runs rebuild the index, incremental runs add the new versions
+        if updates is None:
+            default_text_index_path.unlink(missing_ok=True)
+        text_index = TextIndex()
+        if len(text_index) == 0:
+            text_index.add(df_cleaned)
+        else:
+            text_index.add(updates)
+        text_index.close()
+        written.append(default_text_index_path)
+    if store:
+        with stage("store"):
+            listing_store = ListingStore()
+            # a new or emptied store gets the whole dataset once
+            if updates is None or listing_store.count("listings") == 0:
+                upserted = listing_store.upsert(df_cleaned, "listings")
+            else:
+                upserted = listing_store.upsert(
+                    updates.drop(columns=STATE_COLUMNS, errors="ignore"), "listings"
+                )
+            print(f"Upserted {upserted} listings into {listing_store.path}")
+            listing_store.close()
+    if "id" in df.columns and "last_update" in df.columns:
+        index.record(zip(df["id"], df["last_update"], df["_raw_hash"]))
+
+    print("\nData cleaning completed successfully!")
+    print(f"Cleaned files saved as:")
+    for path in written:
+        print(f"  - {path}")
+
 
-    rental_df, auction_df, sale_df = split_datasets(df_cleaned)
-    rental_df.to_csv(
-        output_dir / "aqar_fm_listings_rental_cleaned.csv",
-        index=False,
-        lineterminator="\n",
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the raw aqar.fm listings")
+    parser.add_argument(
+        "--engine",
+        choices=["c", "pyarrow", "python"],
+        default=None,
+        help="CSV engine used to read the raw listings "
+        "(default: pyarrow if installed, else c)",
     )
-    rental_df.to_json(
-        output_dir / "aqar_fm_listings_rental_cleaned.json",
-        orient="records",
-        force_ascii=False,
-        indent=2,
+    parser.add_argument(
+        "--json-format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="encoding of the JSON outputs: pretty-printed array or JSON Lines",
     )
-    auction_df.to_csv(
-        output_dir / "aqar_fm_listings_auction_cleaned.csv",
-        index=False,
-        lineterminator="\n",
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only clean raw rows that are new or changed since the last run",
     )
-    auction_df.to_json(
-        output_dir / "aqar_fm_listings_auction_cleaned.json",
-        orient="records",
-        force_ascii=False,
-        indent=2,
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the run and write a per-stage report next to the outputs",
     )
-    sale_df.to_csv(
-        output_dir / "aqar_fm_listings_sale_cleaned.csv",
-        index=False,
-        lineterminator="\n",
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="also upsert the cleaned listings into the SQLite listing store",
     )
-    sale_df.to_json(
-        output_dir / "aqar_fm_listings_sale_cleaned.json",
-        orient="records",
-        force_ascii=False,
-        indent=2,
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="clean only the scraper's delta file (needs --incremental)",
     )
-
-    print("\nData cleaning completed successfully!")
-    print(f"Cleaned files saved as:")
-    print(f"  - {processed_dir / 'aqar_fm_listings_cleaned.csv'}")
-    print(f"  - {processed_dir / 'aqar_fm_listings_cleaned.json'}")
-    print(f"  - {output_dir / 'aqar_fm_listings_rental_cleaned.csv'}")
-    print(f"  - {output_dir / 'aqar_fm_listings_rental_cleaned.json'}")
-    print(f"  - {output_dir / 'aqar_fm_listings_auction_cleaned.csv'}")
-    print(f"  - {output_dir / 'aqar_fm_listings_auction_cleaned.json'}")
-    print(f"  - {output_dir / 'aqar_fm_listings_sale_cleaned.csv'}")
-    print(f"  - {output_dir / 'aqar_fm_listings_sale_cleaned.json'}")
-
-
-if __name__ == "__main__":
-    main()
+    args = parser.parse_args()
+    if args.delta and not args.incremental:
+        parser.error("--delta needs --incremental: a delta is not the whole dataset")
+    with profile_run(processed_dir, "clean_data", enabled=args.profile):
+        main(
+            engine=args.engine,
+            json_format=args.json_format,
+            incremental=args.incremental,
+            store=args.store,
+            delta=args.delta,
+        )
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable, Sequence
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+from schema import LISTING_SCHEMA
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+
+# rows buffered before they are transposed into the column buffers
+BATCH_ROWS = 1024
+
+
+class Bitmap:
+    """Growable bitmap, one bit per row, kept as packed chunks."""
+
+    def __init__(self):
+        self.chunks: list[tuple[bytes, int]] = []
+        self.length = 0
+
+    def extend(self, bits: Sequence[bool]) -> None:
+        packed = np.packbits(np.array(bits, dtype=bool), bitorder="little")
+        self.chunks.append((packed.tobytes(), len(bits)))
+        self.length += len(bits)
+
+    def to_numpy(self) -> np.ndarray:
+        if not self.chunks:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate(
+            [
+                np.unpackbits(
+                    np.frombuffer(packed, dtype=np.uint8),
+                    count=length,
+                    bitorder="little",
+                )
+                for packed, length in self.chunks
+            ]
+        ).astype(bool)
+
+
+class FloatBuffer:
+    def __init__(self):
+        self.values = array("d")
+
+    def extend(self, values: Sequence) -> None:
+        # None becomes NaN
+        self.values.frombytes(np.array(values, dtype=np.float64).tobytes())
+
+    def to_array(self):
+        return np.frombuffer(self.values, dtype=np.float64).copy()
+
+
+class IntBuffer:
+    """Nullable integers: `array("q")` values plus a validity bitmap."""
+
+    def __init__(self, dtype: str = "Int64"):
+        self.dtype = dtype
+        self.values = array("q")
+        self.valid = Bitmap()
+
+    def extend(self, values: Sequence) -> None:
+        self.values.extend([0 if value is None else value for value in values])
+        self.valid.extend([value is not None for value in values])
+
+    def to_array(self):
+        values = np.frombuffer(self.values, dtype=np.int64).copy()
+        return pd.arrays.IntegerArray(values, ~self.valid.to_numpy()).astype(self.dtype)
+
+
+class FlagBuffer:
+    """Nullable booleans as a value bitmap and a validity bitmap."""
+
+    def __init__(self):
+        self.values = Bitmap()
+        self.valid = Bitmap()
+
+    def extend(self, values: Sequence) -> None:
+        self.values.extend([bool(value) for value in values])
+        self.valid.extend([value is not None for value in values])
+
+    def to_array(self):
+        return pd.arrays.BooleanArray(self.values.to_numpy(), ~self.valid.to_numpy())
+
+
+class CategoryBuffer:
+    """Interned text: each distinct value is stored once, rows hold codes."""
+
+    def __init__(self):
+        self.codes = array("i")
+        self.lookup: dict[str, int] = {}
+
+    def code(self, value) -> int:
+        if value is None:
+            return -1
+        if isinstance(value, (list, dict)):
+            value = str(value)
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.lookup)
+        return code
+
+    def extend(self, values: Sequence) -> None:
+        code = self.code
+        self.codes.extend([code(value) for value in values])
+
+    def to_array(self):
+        # sorted categories, as astype("category") would produce
+        categories = sorted(self.lookup)
+        remap = np.empty(len(categories) + 1, dtype=np.int32)
+        remap[-1] = -1
+        for new, value in enumerate(categories):
+            remap[self.lookup[value]] = new
+        codes = remap[np.frombuffer(self.codes, dtype=np.int32)]
+        return pd.Categorical.from_codes(codes, categories=categories)
+
+
+class ObjectBuffer:
+    """Free text and lists, kept as Python objects."""
+
+    def __init__(self):
+        self.values = []
+
+    def extend(self, values: Sequence) -> None:
+        self.values.extend(values)
+
+    def to_array(self):
+        return np.array(self.values + [None], dtype=object)[:-1]
+
+
+def column_buffer(
+    dtype: str,
+) -> FloatBuffer | IntBuffer | FlagBuffer | CategoryBuffer | ObjectBuffer:
+    if dtype == "float64":
+        return FloatBuffer()
+    if dtype in ("Int64", "Int8"):
+        return IntBuffer(dtype)
+    if dtype == "boolean":
+        return FlagBuffer()
+    if dtype == "category":
+        return CategoryBuffer()
+    return ObjectBuffer()
+
+
+class ListingColumns:
+    """Listing rows accumulated column by column in typed buffers.
+
+    `append()` takes one row as a tuple in `columns` order; no per-row dict
+    is ever built. Rows are buffered in batches of BATCH_ROWS and then
+    transposed into one buffer per column, chosen from the column's dtype in
+    LISTING_SCHEMA. Rows with another layout (the HTML fallback parser's
+    dicts) are kept aside in `extra_rows` and appended after the typed rows
+    by `to_frame()`.
+    """
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = tuple(columns)
+        self.buffers = [
+            column_buffer(LISTING_SCHEMA.get(column, "object"))
+            for column in self.columns
+        ]
+        self.rows = 0
+        self.pending: list[tuple] = []
+        self.extra_rows: list[dict] = []
+
+    def __len__(self) -> int:
+        return self.rows + len(self.pending) + len(self.extra_rows)
+
+    def append(self, values: tuple) -> None:
+        self.pending.append(values)
+        if len(self.pending) >= BATCH_ROWS:
+            self.flush()
+
+    def extend_rows(self, rows: Iterable[dict]) -> None:
+        self.extra_rows.extend(rows)
+
+    def flush(self) -> None:
+        """Move the buffered rows into the column buffers."""
+        if not self.pending:
+            return
+        for buffer, values in zip(self.buffers, zip(*self.pending), strict=True):
+            buffer.extend(values)
+        self.rows += len(self.pending)
+        self.pending = []
+
+    def to_frame(self) -> pd.DataFrame:
+        self.flush()
+        df = pd.DataFrame(
+            {
+                column: buffer.to_array()
+                for column, buffer in zip(self.columns, self.buffers)
+            },
+            copy=False,
+        )
+        if self.extra_rows:
+            df = pd.concat([df, pd.DataFrame(self.extra_rows)], ignore_index=True)
+        return df
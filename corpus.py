@@ -0,0 +1,78 @@
+import mmap
+import os
+from array import array
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+# File layout: MAGIC, the page bodies back to back, the offsets of every
+# page plus the end offset as native int64, then the page count (int64).
+MAGIC = b"AQARPGS1"
+
+
+def write_corpus(pages: Iterable[str | bytes], path: Path) -> Path:
+    """Write `pages` (UTF-8 encoded if str) as one page corpus file.
+
+    The file is written next to `path` and renamed into place, so processes
+    that still have the previous corpus mapped keep reading a valid file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    offsets = array("q")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        offset = len(MAGIC)
+        for page in pages:
+            body = page.encode("utf-8") if isinstance(page, str) else page
+            offsets.append(offset)
+            f.write(body)
+            offset += len(body)
+        offsets.append(offset)
+        f.write(offsets.tobytes())
+        f.write(array("q", [len(offsets) - 1]).tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+class PageCorpus:
+    """Read-only, memory-mapped view of a page corpus file.
+
+    `corpus[i]` is a zero-copy `memoryview` of page i's UTF-8 body. The
+    mapping is shared through the OS page cache, so any number of processes
+    can open the same corpus without each holding a copy of the pages.
+    Views must be dropped before `close()`.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if self._view[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a page corpus")
+        count = array("q", self._view[-8:].tobytes())[0]
+        index_start = len(self._view) - 8 * (count + 2)
+        self.offsets = array("q", self._view[index_start:-8].tobytes())
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> memoryview:
+        if not 0 <= i < len(self):
+            raise IndexError(f"page {i} out of range")
+        return self._view[self.offsets[i] : self.offsets[i + 1]]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "PageCorpus":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,123 @@
+import sqlite3
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+default_index_path = Path("./data/cache") / "dedupe_index.sqlite"
+
+# SQLite caps the number of bound parameters per statement
+_BATCH_SIZE = 900
+
+
+def _as_int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_str(value) -> str | None:
+    return None if value is None else str(value)
+
+
+def _entries(entries: Iterable[tuple]) -> dict[int, tuple[int | None, str | None]]:
+    """`id -> (last_update, digest)` of `(id, last_update[, digest])` tuples."""
+    result = {}
+    for listing_id, last_update, *digest in entries:
+        listing_id = _as_int(listing_id)
+        if listing_id is not None:
+            result[listing_id] = (
+                _as_int(last_update),
+                _as_str(digest[0]) if digest else None,
+            )
+    return result
+
+
+class DedupeIndex:
+    """Persistent `id -> (last_update, content digest)` index of listings
+    already processed.
+
+    Each pipeline stage keeps its own namespace: the scraper records what it
+    has emitted to the raw files, the cleaner what it has cleaned, each with
+    a digest of the listing's content as that stage sees it. A listing is
+    unchanged for a stage when the stage has seen the same id with the same
+    digest, or with a newer `last_update` (an older copy). Edits that keep
+    the `last_update` change the digest. Entries without a digest are
+    compared by `last_update` alone.
+    """
+
+    def __init__(self, namespace: str, path: Path = default_index_path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # entries of listings passed on but not written yet, see record()
+        self.pending: list[tuple] = []
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen (
+                namespace TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                last_update INTEGER,
+                seen_at INTEGER NOT NULL,
+                digest TEXT,
+                PRIMARY KEY (namespace, id)
+            ) WITHOUT ROWID
+            """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(seen)")]
+        if "digest" not in columns:
+            # indexes from before digests: their listings count as changed
+            # once, then get a digest
+            self.conn.execute("ALTER TABLE seen ADD COLUMN digest TEXT")
+        self.conn.commit()
+
+    def unchanged(self, entries: Iterable[tuple]) -> set[int]:
+        """Ids from `(id, last_update, digest)` entries the index already has
+        up to date; the digest may be left out."""
+        wanted = _entries(entries)
+        ids = list(wanted)
+        result = set()
+        for start in range(0, len(ids), _BATCH_SIZE):
+            batch = ids[start : start + _BATCH_SIZE]
+            rows = self.conn.execute(
+                f"SELECT id, last_update, digest FROM seen WHERE namespace = ? "
+                f"AND id IN ({','.join('?' * len(batch))})",
+                [self.namespace, *batch],
+            )
+            for listing_id, seen_update, seen_digest in rows:
+                last_update, digest = wanted[listing_id]
+                if digest is not None and digest == seen_digest:
+                    result.add(listing_id)
+                elif seen_update is not None and last_update is not None:
+                    newer = seen_update > last_update
+                    if newer or (digest is None and seen_update == last_update):
+                        result.add(listing_id)
+                elif digest is None and last_update is None:
+                    result.add(listing_id)
+        return result
+
+    def record(self, entries: Iterable[tuple]) -> None:
+        """Mark `(id, last_update, digest)` entries as processed by this
+        stage; the digest may be left out."""
+        now = int(time.time())
+        self.conn.executemany(
+            """
+            INSERT INTO seen (namespace, id, last_update, seen_at, digest)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (namespace, id) DO UPDATE SET
+                digest = CASE
+                    WHEN coalesce(excluded.last_update, 0)
+                         >= coalesce(seen.last_update, 0)
+                    THEN excluded.digest ELSE seen.digest END,
+                last_update = max(coalesce(excluded.last_update, 0),
+                                  coalesce(seen.last_update, 0)),
+                seen_at = excluded.seen_at
+            """,
+            (
+                (self.namespace, listing_id, last_update, now, digest)
+                for listing_id, (last_update, digest) in _entries(entries).items()
+            ),
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
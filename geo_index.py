@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = EARTH_RADIUS_KM * math.pi / 180
+
+# Grid cell edge in degrees (~5.5 km north-south), fine enough for city
+# scale queries while keeping the per-row range lookups few
+DEFAULT_CELL_DEGREES = 0.05
+
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray):
+    """Great-circle distances in km from one point to arrays of points."""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """Grid index over listing coordinates for area queries.
+
+    Listings are bucketed into square lat/lng cells and stored sorted by
+    cell, so a query only looks at the rows of the cells it overlaps (one
+    binary search per grid row) and then filters those candidates exactly.
+    `sale_type` and `category_en` are kept as codes for filtering. Built
+    from the cleaned dataset by clean_data.py and saved as `.npz`.
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.ids = arrays["ids"]
+        self.lats = arrays["lats"]
+        self.lngs = arrays["lngs"]
+        self.cells = arrays["cells"]
+        self.sale_type_codes = arrays["sale_type_codes"]
+        self.sale_types = arrays["sale_types"]
+        self.category_codes = arrays["category_codes"]
+        self.categories = arrays["categories"]
+        self.origin_lat, self.origin_lng, self.cell_degrees = arrays["grid"][:3]
+        self.rows, self.cols = (int(n) for n in arrays["grid"][3:])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls, df: pd.DataFrame, cell_degrees: float = DEFAULT_CELL_DEGREES
+    ) -> GeoIndex:
+        """Index the rows of `df` that have both coordinates."""
+        located = df[df["latitude"].notna() & df["longitude"].notna()]
+        lats = located["latitude"].to_numpy(dtype=np.float64)
+        lngs = located["longitude"].to_numpy(dtype=np.float64)
+        sale_type_codes, sale_types = pd.factorize(
+            located["sale_type"].astype("string"), sort=True
+        )
+        category_codes, categories = pd.factorize(
+            located["category_en"].astype("string"), sort=True
+        )
+        origin_lat = (
+            np.floor(lats.min() / cell_degrees) * cell_degrees if len(lats) else 0
+        )
+        origin_lng = (
+            np.floor(lngs.min() / cell_degrees) * cell_degrees if len(lngs) else 0
+        )
+        rows = int((lats.max() - origin_lat) // cell_degrees) + 1 if len(lats) else 1
+        cols = int((lngs.max() - origin_lng) // cell_degrees) + 1 if len(lngs) else 1
+        cells = ((lats - origin_lat) // cell_degrees).astype(np.int64) * cols + (
+            (lngs - origin_lng) // cell_degrees
+        ).astype(np.int64)
+        order = np.argsort(cells, kind="stable")
+        return cls(
+            {
+                "ids": pd.to_numeric(located["id"]).to_numpy(dtype=np.int64)[order],
+                "lats": lats[order],
+                "lngs": lngs[order],
+                "cells": cells[order],
+                "sale_type_codes": sale_type_codes.astype(np.int16)[order],
+                "sale_types": np.asarray(sale_types, dtype=str),
+                "category_codes": category_codes.astype(np.int16)[order],
+                "categories": np.asarray(categories, dtype=str),
+                "grid": np.array(
+                    [origin_lat, origin_lng, cell_degrees, rows, cols], dtype=np.float64
+                ),
+            }
+        )
+
+    def save(self, path: Path) -> Path:
+        np.savez(
+            path,
+            ids=self.ids,
+            lats=self.lats,
+            lngs=self.lngs,
+            cells=self.cells,
+            sale_type_codes=self.sale_type_codes,
+            sale_types=self.sale_types,
+            category_codes=self.category_codes,
+            categories=self.categories,
+            grid=np.array(
+                [
+                    self.origin_lat,
+                    self.origin_lng,
+                    self.cell_degrees,
+                    self.rows,
+                    self.cols,
+                ]
+            ),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> GeoIndex:
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def _candidates(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        sale_type: str | None,
+        category: str | None,
+    ) -> np.ndarray:
+        """Positions in the cells overlapping the box that pass the filters."""
+        size = self.cell_degrees
+        row_lo = max(int((min_lat - self.origin_lat) // size), 0)
+        row_hi = min(int((max_lat - self.origin_lat) // size), self.rows - 1)
+        col_lo = max(int((min_lng - self.origin_lng) // size), 0)
+        col_hi = min(int((max_lng - self.origin_lng) // size), self.cols - 1)
+        if row_lo > row_hi or col_lo > col_hi or not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        # the cells of one grid row are contiguous in the sorted order
+        grid_rows = np.arange(row_lo, row_hi + 1) * self.cols
+        starts = np.searchsorted(self.cells, grid_rows + col_lo, side="left")
+        stops = np.searchsorted(self.cells, grid_rows + col_hi, side="right")
+        positions = np.concatenate(
+            [np.arange(start, stop) for start, stop in zip(starts, stops)]
+        )
+        if sale_type is not None:
+            positions = positions[
+                self.sale_type_codes[positions]
+                == self._code(self.sale_types, sale_type)
+            ]
+        if category is not None:
+            positions = positions[
+                self.category_codes[positions] == self._code(self.categories, category)
+            ]
+        return positions
+
+    @staticmethod
+    def _code(values: np.ndarray, value: str) -> int:
+        matches = np.flatnonzero(values == value)
+        return int(matches[0]) if len(matches) else -2
+
+    def bbox(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        sale_type: str | None = None,
+        category: str | None = None,
+    ) -> np.ndarray:
+        """Ids of the listings inside the bounding box."""
+        positions = self._candidates(
+            min_lat, min_lng, max_lat, max_lng, sale_type, category
+        )
+        lats, lngs = self.lats[positions], self.lngs[positions]
+        inside = (
+            (lats >= min_lat)
+            & (lats <= max_lat)
+            & (lngs >= min_lng)
+            & (lngs <= max_lng)
+        )
+        return self.ids[positions[inside]]
+
+    def radius(
+        self,
+        lat: float,
+        lng: float,
+        km: float,
+        sale_type: str | None = None,
+        category: str | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Ids and distances (km) of the listings within `km`, nearest first."""
+        dlat = km / KM_PER_DEGREE_LAT
+        # longitude degrees shrink towards the poles; widen by the box's
+        # highest latitude so the box always contains the circle
+        max_abs_lat = min(abs(lat) + dlat, 89.9)
+        dlng = km / (KM_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat)))
+        positions = self._candidates(
+            lat - dlat, lng - dlng, lat + dlat, lng + dlng, sale_type, category
+        )
+        distances = haversine_km(lat, lng, self.lats[positions], self.lngs[positions])
+        within = distances <= km
+        positions, distances = positions[within], distances[within]
+        order = np.argsort(distances, kind="stable")
+        return self.ids[positions[order]], distances[order]
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        n: int,
+        sale_type: str | None = None,
+        category: str | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Ids and distances (km) of the `n` listings nearest to the point."""
+        # grow the search radius until it holds n listings or the whole grid
+        km = self.cell_degrees * KM_PER_DEGREE_LAT
+        max_km = math.pi * EARTH_RADIUS_KM
+        while True:
+            ids, distances = self.radius(lat, lng, km, sale_type, category)
+            if len(ids) >= n or km >= max_km:
+                return ids[:n], distances[:n]
+            km *= 2
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+from listing_store import sql_value
+from schema import CATEGORY_COLUMNS, LISTING_COLUMNS, PRICE_COLUMNS
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+default_history_path = Path("./data") / "history.sqlite"
+
+# Not tracked: the key, the timestamp changes are stamped with, and the
+# category fields, which follow from category_id
+TRACKED_COLUMNS = [
+    col
+    for col in LISTING_COLUMNS
+    if col not in ("id", "last_update") and col not in CATEGORY_COLUMNS[1:]
+]
+
+# SQLite caps the number of bound parameters per statement
+_BATCH_SIZE = 900
+
+
+class HistoryLog:
+    """Append-only log of the column values of listings over time.
+
+    Every change is one `changes` row: listing id, the column, its old and
+    new value, `changed_at` (the listing's `last_update`, or the recording
+    time if it has none) and `recorded_at` (when the run saw it). The first
+    time a listing is seen, it is only stored in `latest`, which keeps the
+    last recorded version of each listing to diff against; after that only
+    the columns that differ are logged. Nothing but `latest` is ever
+    updated or deleted, and earlier versions follow from `latest` and the
+    old values of the changes.
+    """
+
+    def __init__(self, path: Path = default_history_path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS changes (
+                    id INTEGER NOT NULL,
+                    changed_at INTEGER NOT NULL,
+                    recorded_at INTEGER NOT NULL,
+                    column TEXT NOT NULL,
+                    old_value,
+                    new_value
+                )
+                """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS changes_id ON changes (id, changed_at)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS changes_column "
+                "ON changes (column, changed_at)"
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS latest (
+                    id INTEGER PRIMARY KEY,
+                    last_update INTEGER,
+                    listing TEXT NOT NULL
+                )
+                """)
+
+    def _latest(self, ids: list[int]) -> dict[int, tuple[int | None, str]]:
+        """`id -> (last_update, JSON listing)` of the last recorded versions."""
+        latest = {}
+        for start in range(0, len(ids), _BATCH_SIZE):
+            batch = ids[start : start + _BATCH_SIZE]
+            rows = self.conn.execute(
+                f"SELECT id, last_update, listing FROM latest "
+                f"WHERE id IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for listing_id, last_update, listing in rows:
+                latest[listing_id] = (last_update, listing)
+        return latest
+
+    def record(self, df: pd.DataFrame, recorded_at: int | None = None) -> int:
+        """Log what changed in the listings of `df`; returns changes logged.
+
+        Listings seen for the first time log no changes. Rows older (by
+        `last_update`) than the recorded version are skipped.
+        """
+        recorded_at = int(time.time()) if recorded_at is None else recorded_at
+        columns = [col for col in TRACKED_COLUMNS if col in df.columns]
+        frame = df.reindex(columns=["id", "last_update", *columns]).astype(object)
+        frame["id"] = pd.to_numeric(frame["id"], errors="coerce")
+        frame = frame[frame["id"].notna()].drop_duplicates("id", keep="last")
+        frame = frame.where(frame.notna(), None)
+        rows = list(frame.itertuples(index=False, name=None))
+        latest = self._latest([int(row[0]) for row in rows])
+
+        changes, versions = [], []
+        for listing_id, last_update, *values in rows:
+            listing_id = int(listing_id)
+            seen_update, seen_listing = latest.get(listing_id, (None, None))
+            if (
+                last_update is not None
+                and seen_update is not None
+                and last_update < seen_update
+            ):
+                continue
+            current = dict(zip(columns, values))
+            listing = json.dumps(current, ensure_ascii=False)
+            if listing == seen_listing:
+                # most listings are unchanged, skip the per-column diff
+                if last_update != seen_update:
+                    versions.append((listing_id, last_update, listing))
+                continue
+            versions.append((listing_id, last_update, listing))
+            if seen_listing is None:
+                continue
+            seen = json.loads(seen_listing)
+            changed_at = recorded_at if last_update is None else last_update
+            for column, value in current.items():
+                old = seen.get(column)
+                if value != old and not (value is None and column not in seen):
+                    changes.append(
+                        (
+                            listing_id,
+                            changed_at,
+                            recorded_at,
+                            column,
+                            sql_value(old),
+                            sql_value(value),
+                        )
+                    )
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?)", changes
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO latest VALUES (?, ?, ?)", versions
+            )
+        return len(changes)
+
+    def history(self, listing_id: int) -> pd.DataFrame:
+        """Every logged change of one listing, oldest first."""
+        return pd.read_sql_query(
+            "SELECT changed_at, recorded_at, column, old_value, new_value "
+            "FROM changes WHERE id = ? ORDER BY changed_at, rowid",
+            self.conn,
+            params=[int(listing_id)],
+        )
+
+    def price_drops(
+        self, since: int, columns: list[str] = PRICE_COLUMNS
+    ) -> pd.DataFrame:
+        """Price decreases with `changed_at >= since`, most recent first."""
+        return pd.read_sql_query(
+            f"SELECT id, changed_at, column, old_value, new_value, "
+            f"new_value - old_value AS change "
+            f"FROM changes WHERE column IN ({','.join('?' * len(columns))}) "
+            f"AND changed_at >= ? AND new_value < old_value "
+            f"ORDER BY changed_at DESC",
+            self.conn,
+            params=[*columns, int(since)],
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the listing history log")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--listing", type=int, help="print the history of a listing")
+    group.add_argument(
+        "--price-drops-since",
+        type=int,
+        metavar="UNIX_TIME",
+        help="print the price drops since a unix timestamp",
+    )
+    parser.add_argument("--history", type=Path, default=default_history_path)
+    args = parser.parse_args()
+
+    log = HistoryLog(args.history)
+    if args.listing is not None:
+        print(log.history(args.listing).to_string(index=False))
+    else:
+        print(log.price_drops(args.price_drops_since).to_string(index=False))
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal
+
+from lazy import lazy_import
+from schema import LISTING_COLUMNS, LISTING_SCHEMA
+from sinks import SinkFormat, write_frame
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+default_store_path = Path("./data") / "listings.sqlite"
+
+# raw_listings is written by the scraper, listings by the cleaner
+ListingTable = Literal["raw_listings", "listings"]
+TABLES: tuple[str, ...] = ("raw_listings", "listings")
+
+SQL_TYPES = {
+    "float64": "REAL",
+    "Int64": "INTEGER",
+    "Int8": "INTEGER",
+    "boolean": "INTEGER",
+    "string": "TEXT",
+    "category": "TEXT",
+}
+
+# column(s) -> index; `id` is the primary key
+INDEXES = [
+    ("city", "district"),
+    ("sale_type",),
+    ("category_en",),
+    ("category_id",),
+    ("create_time",),
+    ("price",),
+]
+
+# rows per executemany() call
+_BATCH_SIZE = 1000
+
+
+def sql_value(value):
+    """Python value SQLite can store: NA -> NULL, lists/dicts -> JSON text."""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class ListingStore:
+    """SQLite store of the listings, one row per `id`, with query indexes.
+
+    Holds the scraper's rows (`raw_listings`) and the cleaner's
+    (`listings`) with the columns of the listing schema. Both are written
+    with batched upserts, so re-runs and incremental runs update listings
+    in place. List columns (`images`, `videos`) are stored as JSON text.
+    """
+
+    def __init__(self, path: Path = default_store_path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        columns = ",\n".join(
+            f'"{col}" {SQL_TYPES[dtype]}' + (" PRIMARY KEY" if col == "id" else "")
+            for col, dtype in LISTING_SCHEMA.items()
+        )
+        with self.conn:
+            for table in TABLES:
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+                # stores created before a column joined the schema
+                existing = {
+                    row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")
+                }
+                for col, dtype in LISTING_SCHEMA.items():
+                    if col not in existing:
+                        self.conn.execute(
+                            f'ALTER TABLE {table} ADD COLUMN "{col}" {SQL_TYPES[dtype]}'
+                        )
+                for index_columns in INDEXES:
+                    name = f"{table}_{'_'.join(index_columns)}"
+                    self.conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {name} "
+                        f"ON {table} ({', '.join(index_columns)})"
+                    )
+
+    def _rows(self, df: pd.DataFrame) -> Iterator[tuple]:
+        frame = df.reindex(columns=LISTING_COLUMNS).astype(object)
+        frame["id"] = pd.to_numeric(frame["id"], errors="coerce")
+        frame = frame[frame["id"].notna()]
+        frame["id"] = frame["id"].astype("int64").astype(object)
+        for row in frame.itertuples(index=False, name=None):
+            yield tuple(sql_value(value) for value in row)
+
+    def upsert(self, df: pd.DataFrame, table: ListingTable) -> int:
+        """Insert or replace rows of `df` by `id`; returns rows written.
+
+        Rows without a usable id are skipped. Columns outside the listing
+        schema are ignored, missing ones stored as NULL.
+        """
+        if table not in TABLES:
+            raise ValueError(f"Unknown listing table: {table}")
+        columns = ", ".join(f'"{col}"' for col in LISTING_COLUMNS)
+        placeholders = ", ".join("?" * len(LISTING_COLUMNS))
+        updates = ", ".join(
+            f'"{col}" = excluded."{col}"' for col in LISTING_COLUMNS if col != "id"
+        )
+        sql = (
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (id) DO UPDATE SET {updates}"
+        )
+        written = 0
+        batch = []
+        with self.conn:
+            for row in self._rows(df):
+                batch.append(row)
+                if len(batch) == _BATCH_SIZE:
+                    self.conn.executemany(sql, batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                self.conn.executemany(sql, batch)
+                written += len(batch)
+        return written
+
+    def count(self, table: ListingTable = "listings") -> int:
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def query(
+        self,
+        table: ListingTable = "listings",
+        *,
+        ids: list[int] | None = None,
+        city: str | None = None,
+        district: str | None = None,
+        sale_type: str | None = None,
+        category: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        created_after: int | None = None,
+        created_before: int | None = None,
+        columns: list[str] | None = None,
+        order_by: str | None = None,
+        limit: int | None = None,
+    ) -> pd.DataFrame:
+        """Listings matching every given filter, served from the indexes.
+
+        `category` matches `category_en`; `created_after`/`created_before`
+        are unix timestamps compared with `create_time`. `order_by` is a
+        column name, prefixed with `-` for descending order.
+        """
+        if table not in TABLES:
+            raise ValueError(f"Unknown listing table: {table}")
+        selected = columns or LISTING_COLUMNS
+        unknown = [col for col in selected if col not in LISTING_SCHEMA]
+        if unknown:
+            raise ValueError(f"Columns not in listing schema: {unknown}")
+
+        where, params = [], []
+        for sql, value in [
+            ("city = ?", city),
+            ("district = ?", district),
+            ("sale_type = ?", sale_type),
+            ("category_en = ?", category),
+            ("price >= ?", min_price),
+            ("price <= ?", max_price),
+            ("create_time >= ?", created_after),
+            ("create_time <= ?", created_before),
+        ]:
+            if value is not None:
+                where.append(sql)
+                params.append(value)
+        if ids is not None:
+            where.append(f"id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps([int(i) for i in ids]))
+
+        sql = f"SELECT {', '.join(f'"{col}"' for col in selected)} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if order_by:
+            column = order_by.lstrip("-")
+            if column not in LISTING_SCHEMA:
+                raise ValueError(f"Cannot order by unknown column: {column}")
+            sql += f' ORDER BY "{column}"' + (
+                " DESC" if order_by.startswith("-") else ""
+            )
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def get(self, listing_id: int, table: ListingTable = "listings") -> dict | None:
+        """One listing as a dict, or None if the store does not have it."""
+        rows = self.query(table, ids=[listing_id])
+        return rows.iloc[0].to_dict() if len(rows) else None
+
+    def export(
+        self, path: Path, table: ListingTable = "listings", format: SinkFormat = "csv"
+    ) -> Path:
+        """Write a whole table as CSV/JSON/JSON Lines, a view of the store."""
+        return write_frame(self.query(table, order_by="id"), path, format)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the listing store")
+    parser.add_argument("output", type=Path, help="file to write")
+    parser.add_argument("--table", choices=TABLES, default="listings")
+    parser.add_argument("--format", choices=["csv", "json", "jsonl"], default="csv")
+    parser.add_argument("--store", type=Path, default=default_store_path)
+    args = parser.parse_args()
+
+    store = ListingStore(args.store)
+    print(f"Exported to {store.export(args.output, args.table, args.format)}")
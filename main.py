@@ -1,31 +1,168 @@
+from __future__ import annotations
+
 from pathlib import Path
-from typing import Literal
-import httpx
+from typing import TYPE_CHECKING, Callable, Iterable, Literal
+import argparse
+import hashlib
+import importlib.util
 import json
-import os
-from dotenv import load_dotenv
-from joblib import Memory
-from bs4 import BeautifulSoup
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
+import pickle
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache, partial
+from lazy import lazy_import
+from schema import conform_listings, read_listings_csv, validate_listings
+from columnar import ListingColumns
+from corpus import PageCorpus, write_corpus
+from dedupe_index import DedupeIndex
+from history import HistoryLog, default_history_path
+from listing_store import ListingStore, default_store_path
+from metrics import registry
+from page_body import ACCEPT_ENCODING, PageBody, page_content
+from pagination import PAGES_REFETCHED, PAGINATION_GAPS, DriftTracker, drop_seen
+from profiling import profile_run, stage
+from revisit import RevisitScheduler
+from sessions import SessionPool, load_credentials, load_session_rate
 
-load_dotenv()
+if TYPE_CHECKING:
+    import httpx
+    import pandas as pd
+else:
+    httpx = lazy_import("httpx")
+    pd = lazy_import("pandas")
 
 data_dir = Path("./data")
 raw_dir = data_dir / "raw"
 processed_dir = data_dir / "processed"
 cache_dir = data_dir / "cache"
+# fetched pages saved for re-parsing, see corpus.py
+corpus_path = raw_dir / "pages.corpus"
 
-raw_dir.mkdir(parents=True, exist_ok=True)
-processed_dir.mkdir(parents=True, exist_ok=True)
-
-memory = Memory(cache_dir / "joblibdir", verbose=0)
+# page cache (joblib.Memory) and the cached download_page, set up by init()
+memory = None
+_cached_download_page = None
+# parse result cache, keyed by page content hash and PARSER_VERSION
+parse_memory = None
+_cached_page_rows = None
+# one client per credential set, set up by init()
+session_pool: SessionPool | None = None
+_init_lock = threading.Lock()
 
 STOP_PAGE = float("inf")
+MAX_WORKERS = 10
+# retries of a request answered with a server error, with exponential backoff
+MAX_SERVER_ERRORS = 5
+
+# Bump whenever the rows built from a page change (new fields, parser
+# fixes), so that parse results cached by an older parser are not reused
+PARSER_VERSION = 3
+# the parse cache is trimmed to this size after each run, least recently
+# used results first
+PARSE_CACHE_BYTES = "1G"
+
+FETCH_SECONDS = registry.histogram(
+    "aqar_fetch_seconds", "Latency of page requests that went to the network"
+)
+FETCH_BYTES = registry.counter(
+    "aqar_fetch_bytes_total", "Response bytes received from the network"
+)
+FETCH_TIMEOUTS = registry.counter("aqar_fetch_timeouts_total", "Timed out requests")
+FETCH_SERVER_ERRORS = registry.counter(
+    "aqar_fetch_server_errors_total", "Requests answered with a server error (5xx)"
+)
+PAGES_FAILED = registry.counter(
+    "aqar_pages_failed_total", "Pages skipped after MAX_SERVER_ERRORS retries"
+)
+PAGE_CACHE_HITS = registry.counter("aqar_page_cache_hits_total", "Page cache hits")
+PAGE_CACHE_MISSES = registry.counter(
+    "aqar_page_cache_misses_total", "Page cache misses (fetched from the network)"
+)
+FETCH_QUEUE_DEPTH = registry.gauge(
+    "aqar_fetch_queue_depth", "Page URLs waiting for a fetch worker"
+)
+WORKER_BUSY_SECONDS = registry.counter(
+    "aqar_fetch_worker_busy_seconds_total", "Time fetch workers spent on pages"
+)
+WORKER_UTILIZATION = registry.gauge(
+    "aqar_fetch_worker_utilization", "Busy share of fetch worker time in the crawl"
+)
+PARSE_SECONDS = registry.histogram("aqar_parse_seconds", "Parse time per page")
+PARSE_CACHE_HITS = registry.counter(
+    "aqar_parse_cache_hits_total", "Pages whose rows came from the parse cache"
+)
+PARSE_CACHE_MISSES = registry.counter(
+    "aqar_parse_cache_misses_total", "Pages parsed because they were not cached"
+)
+LISTINGS_PER_PAGE = registry.histogram(
+    "aqar_listings_per_page",
+    "Listings parsed from each page",
+    buckets=(0, 1, 5, 10, 15, 20, 30, 50, 100),
+)
+
+# set by download_page when it runs, i.e. on a page cache miss
+_fetch_state = threading.local()
+# set by _page_rows when it runs, i.e. on a parse cache miss
+_parse_state = threading.local()
+
+# served past the last page of results
+NO_RESULTS_MARKER = "لا توجد نتائج".encode()
+
+# browser headers sent by every session, see sessions.py
+REQUEST_HEADERS = {
+    "accept-encoding": ACCEPT_ENCODING,
+    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "accept-language": "en-US,en;q=0.9,ar;q=0.8",
+    "cache-control": "no-cache",
+    "pragma": "no-cache",
+    "priority": "u=0, i",
+    "referer": "https://duckduckgo.com/",
+    "sec-ch-ua": '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Linux"',
+    "sec-fetch-dest": "document",
+    "sec-fetch-mode": "navigate",
+    "sec-fetch-site": "same-origin",
+    "sec-fetch-user": "?1",
+    "upgrade-insecure-requests": "1",
+    "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
+}
+
+
+def init() -> None:
+    """Load `.env`, create the data directories and open the page cache.
+
+    Importing this module has no side effects; everything that needs this
+    state calls init() first.
+    """
+    global memory, _cached_download_page, parse_memory, _cached_page_rows
+    global session_pool
+    with _init_lock:
+        if memory is not None:
+            return
+        from dotenv import load_dotenv
+        from joblib import Memory
 
+        load_dotenv()
+        raw_dir.mkdir(parents=True, exist_ok=True)
+        processed_dir.mkdir(parents=True, exist_ok=True)
+        memory = Memory(cache_dir / "joblibdir", verbose=0)
+        _cached_download_page = memory.cache(download_page)
+        parse_memory = Memory(cache_dir / "parsed", verbose=0)
+        # the page itself is represented by its hash in the key
+        _cached_page_rows = parse_memory.cache(_page_rows, ignore=["page"])
+        session_pool = SessionPool(
+            load_credentials(), REQUEST_HEADERS, rate=load_session_rate()
+        )
+
+
+def fetch_data(url: str, use_cache: bool = True) -> PageBody | None:
+    """Page at `url`, or None once past the last page of results.
 
-@memory.cache
-def fetch_data(url: str) -> str | None:
+    A page the server keeps failing (5xx) is skipped with None as well, so
+    one bad page does not stop the crawl.
+    """
     global STOP_PAGE
     try:
         page_num = int(url.split("/")[-1])
@@ -33,156 +170,234 @@ def fetch_data(url: str) -> str | None:
         page_num = 0
 
     if page_num >= STOP_PAGE:
+        _fetch_state.outcome = "skipped"
         return None
 
-    cookies = {
-        "req-device-token": os.getenv("REQ_DEVICE_TOKEN", "get-your-cookies"),
-        "cf_clearance": os.getenv("CF_CLEARANCE", "get-your-cookies"),
-        "__cf_bm": os.getenv("CF_BM", "get-your-cookies"),
-    }
+    init()
+    try:
+        page = _cached_download_page(url) if use_cache else download_page(url)
+    except httpx.HTTPStatusError as e:
+        PAGES_FAILED.inc()
+        print(f"Skipping {url} after {e.response.status_code} on every retry")
+        return None
+    if page is None:
+        STOP_PAGE = min(STOP_PAGE, page_num)
+    return page
 
-    headers = {
-        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "accept-language": "en-US,en;q=0.9,ar;q=0.8",
-        "cache-control": "no-cache",
-        "pragma": "no-cache",
-        "priority": "u=0, i",
-        "referer": "https://duckduckgo.com/",
-        "sec-ch-ua": '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"Linux"',
-        "sec-fetch-dest": "document",
-        "sec-fetch-mode": "navigate",
-        "sec-fetch-site": "same-origin",
-        "sec-fetch-user": "?1",
-        "upgrade-insecure-requests": "1",
-        "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
-    }
+
+def download_page(url: str) -> PageBody | None:
+    """Request `url`; None for the "no results" page past the last one.
+
+    The page is returned (and cached) compressed as it was received; it is
+    only decompressed and decoded when parsed.
+    """
+    _fetch_state.outcome = "miss"
 
     timeout = 30
+    server_errors = 0
     while True:
+        start = time.perf_counter()
         try:
-            response = httpx.get(
-                url,
-                cookies=cookies,
-                headers=headers,
-                timeout=timeout,
-                follow_redirects=True,
-            )
+            body = session_pool.get(url, timeout=timeout)
+            FETCH_SECONDS.observe(time.perf_counter() - start)
+            FETCH_BYTES.inc(len(body.data))
             break
         except httpx.ReadTimeout:
+            FETCH_TIMEOUTS.inc()
             print(
                 f"Timeout fetching {url} with {timeout}s, retrying with {timeout + 10}s..."
             )
             timeout += 10
+        except httpx.HTTPStatusError as e:
+            FETCH_SERVER_ERRORS.inc()
+            server_errors += 1
+            if server_errors > MAX_SERVER_ERRORS:
+                raise
+            delay = 2 ** (server_errors - 1)
+            print(f"{e.response.status_code} fetching {url}, retrying in {delay}s...")
+            time.sleep(delay)
+
+    if NO_RESULTS_MARKER in body.content():
+        return None
 
-    textof = response.text
+    print(f"Fetched data from {url}")
+    return body
 
-    assert not "you have been blocked" in textof.lower(), "Blocked by the website"
 
-    if "لا توجد نتائج" in textof:
-        STOP_PAGE = min(STOP_PAGE, page_num)
+# Fallback (no __NEXT_DATA__) parsing of the rendered listing cards
+LISTING_CARD_SELECTOR = "#__next > main > div > div._root__Szbd6 > div > div:nth-child(2) > div._container__Lu67A > div._list__Ka30R > div"
+CARD_SELECTORS = {
+    "price": "a > div > div._content__W4gas > div._price__X51mi",
+    "title": "a > div > div._content__W4gas > div._titleRow__1AWv1 > h4",
+    "link": "a",
+    "description": "a > div > div._content__W4gas > div._description__zVaD6",
+    "city": "a > div > div._content__W4gas > div._footer__CnldH > p > span:nth-child(1)",
+    "district": "a > div > div._content__W4gas > div._footer__CnldH > p > span:nth-child(2)",
+    "spec_icons": "a > div > div._content__W4gas > div._specs__nbsgm .icon_icon___L1OO img[src]",
+}
+ICON_MAP = {
+    "area": "area_sqm",
+    "bed-king": "num_bedrooms",
+    "bath": "num_bathrooms",
+    "couch": "num_living_rooms",
+    "pinned-note": "zoning",
+    "street": "street_width",
+}
+# spec icon fields holding a number (with a unit, e.g. "116 م²")
+NUMERIC_SPECS = {
+    "area_sqm",
+    "num_bedrooms",
+    "num_bathrooms",
+    "num_living_rooms",
+    "street_width",
+}
+RENTAL_KEYWORDS = ["ايجار", "شهري", "سنوي"]
+_CARD_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def _card_number(text: str | None) -> float | None:
+    """First number in a card text, read without its thousands separators."""
+    match = _CARD_NUMBER.search(text) if text else None
+    return float(match.group().replace(",", "")) if match else None
+
+
+def _is_auction(strornum):
+    if not strornum:
         return None
+    if "مزاد" in strornum:
+        return True
+    return False
 
-    print(f"Fetched data from {url}")
-    return textof
 
+def _get_type(string: str) -> str | None:
+    if string:
+        for keyword in RENTAL_KEYWORDS:
+            if keyword in string:
+                return "rental"
+        if _is_auction(string):
+            return "auction"
+        return "sale"
+    return None
 
-def parse_category_page(page: str) -> list[dict]:
-    output = []
-    soup = BeautifulSoup(page, "html.parser")
-    listings = soup.select(
-        "#__next > main > div > div._root__Szbd6 > div > div:nth-child(2) > div._container__Lu67A > div._list__Ka30R > div"
+
+def _card_row(
+    texts: dict[str, str | None], href: str | None, specs: list[tuple[str, str]]
+) -> dict:
+    """Row of one listing card from its extracted texts, link and spec icons."""
+    priceorauction = texts["price"]
+    sale_type = _get_type(priceorauction)
+
+    dict_item = {}
+    dict_item["title"] = texts["title"]
+    dict_item["url"] = "https://sa.aqar.fm" + href if href is not None else None
+    # auctions show no price; rentals follow the number with the period
+    dict_item["price"] = (
+        None if sale_type == "auction" else _card_number(priceorauction)
     )
-    for listing in listings:
-
-        def get_text(selector):
-            element = listing.select_one(selector)
-            return element.get_text(separator=" ") if element else None
-
-        def is_auction(strornum):
-            if not strornum:
-                return None
-            if "مزاد" in strornum:
-                return True
-            return False
-
-        def get_type(string: str) -> str | None:
-            rental_keywords = ["ايجار", "شهري", "سنوي"]
-            if string:
-                for keyword in rental_keywords:
-                    if keyword in string:
-                        return "rental"
-                if is_auction(string):
-                    return "auction"
-                return "sale"
-            return None
+    dict_item["description"] = texts["description"]
+    dict_item["city"] = texts["city"]
+    dict_item["district"] = texts["district"]
+    dict_item["sale_type"] = sale_type
+    for src, value in specs:
+        if not src:
+            continue
+        icon_name = src.split("/")[-1].split(".")[0]
+        field = ICON_MAP.get(icon_name, icon_name)
+        if value == "undefined":
+            value = None
+        dict_item[field] = _card_number(value) if field in NUMERIC_SPECS else value
+    return dict_item
 
-        priceorauction = get_text("a > div > div._content__W4gas > div._price__X51mi")
 
-        sale_type = get_type(priceorauction)
+def _html_backend() -> str:
+    for backend in ("selectolax", "lxml"):
+        if importlib.util.find_spec(backend):
+            return backend
+    return "html.parser"
 
-        dict_item = {}
-        dict_item["title"] = get_text(
-            "a > div > div._content__W4gas > div._titleRow__1AWv1 > h4"
-        )
-        listing_url = listing.select_one("a")
-        dict_item["url"] = (
-            "https://sa.aqar.fm" + listing_url["href"]
-            if listing_url and "href" in listing_url.attrs
-            else None
-        )
-        if sale_type == "auction":
-            dict_item["price"] = None
-        elif sale_type == "rental":
-            # for rentals, keep only the number part
-            dict_item["price"] = priceorauction.split(" ")[0]
-        else:
-            # for sales there is only a number part
-            dict_item["price"] = (
-                priceorauction if not is_auction(priceorauction) else None
-            )
-        dict_item["description"] = get_text(
-            "a > div > div._content__W4gas > div._description__zVaD6"
-        )
-        dict_item["city"] = get_text(
-            "a > div > div._content__W4gas > div._footer__CnldH > p > span:nth-child(1)"
-        )
-        dict_item["district"] = get_text(
-            "a > div > div._content__W4gas > div._footer__CnldH > p > span:nth-child(2)"
-        )
-        dict_item["sale_type"] = sale_type
-        svgimgs = listing.select(
-            "a > div > div._content__W4gas > div._specs__nbsgm .icon_icon___L1OO img[src]"
-        )
-        svgurl2span = {img["src"]: img.parent for img in svgimgs}
-        for k, span in svgurl2span.items():
-            if not k:
-                continue
-            icon_name = k.split("/")[-1].split(".")[ # ty:ignore[possibly-missing-attribute]
-                0
-            ]  
-            value = span.parent.get_text( # ty:ignore[possibly-missing-attribute]
-                strip=True
-            )  
-            icon_map = {
-                "area": "area_sqm",
-                "bed-king": "num_bedrooms",
-                "bath": "num_bathrooms",
-                "couch": "num_living_rooms",
-                "pinned-note": "zoning",
-                "street": "street-width",
-            }
-
-            icon_value = icon_map.get(icon_name, icon_name)
-            dict_item[icon_value] = value if value != "undefined" else None
-        output.append(dict_item)
+
+# fastest available of selectolax, BeautifulSoup+lxml, BeautifulSoup+html.parser
+HTML_BACKEND = _html_backend()
+
+
+@cache
+def _compiled_card_selectors():
+    import soupsieve
+
+    return soupsieve.compile(LISTING_CARD_SELECTOR), {
+        name: soupsieve.compile(selector) for name, selector in CARD_SELECTORS.items()
+    }
+
+
+def _parse_cards_bs4(page: str, parser: str) -> list[dict]:
+    from bs4 import BeautifulSoup
+
+    card_selector, selectors = _compiled_card_selectors()
+    text_fields = ("price", "title", "description", "city", "district")
+    output = []
+    soup = BeautifulSoup(page, parser)
+    for listing in card_selector.select(soup):
+        texts = {}
+        for name in text_fields:
+            element = selectors[name].select_one(listing)
+            texts[name] = element.get_text(separator=" ") if element else None
+        link = selectors["link"].select_one(listing)
+        href = link.get("href") if link else None
+        # one value per distinct icon, as the page repeats some of them
+        specs = {
+            img["src"]: img.parent.parent.get_text(strip=True)
+            for img in selectors["spec_icons"].select(listing)
+        }
+        output.append(_card_row(texts, href, list(specs.items())))
     return output
 
 
-def get_category_details(key: str):
-    json_data = """
-    {
+def _lexbor_text(node) -> str:
+    # BeautifulSoup's get_text(separator=" "), including its collapsing of
+    # whitespace-only strings to a single newline or space
+    strings = []
+    for child in node.traverse(include_text=True):
+        if child.tag != "-text":
+            continue
+        string = child.text_content
+        if not string.strip():
+            string = "\n" if "\n" in string else " "
+        strings.append(string)
+    return " ".join(strings)
+
+
+def _parse_cards_selectolax(page: str) -> list[dict]:
+    from selectolax.lexbor import LexborHTMLParser
+
+    text_fields = ("price", "title", "description", "city", "district")
+    output = []
+    tree = LexborHTMLParser(page)
+    for listing in tree.css(LISTING_CARD_SELECTOR):
+        texts = {}
+        for name in text_fields:
+            element = listing.css_first(CARD_SELECTORS[name])
+            texts[name] = _lexbor_text(element) if element else None
+        link = listing.css_first(CARD_SELECTORS["link"])
+        href = link.attributes.get("href") if link else None
+        specs = {
+            img.attributes["src"]: img.parent.parent.text(strip=True)
+            for img in listing.css(CARD_SELECTORS["spec_icons"])
+        }
+        output.append(_card_row(texts, href, list(specs.items())))
+    return output
+
+
+def parse_category_page(page: str | bytes | memoryview) -> list[dict]:
+    """Fallback parser reading the rendered listing cards of a category page."""
+    if isinstance(page, memoryview):
+        page = bytes(page)
+    if HTML_BACKEND == "selectolax":
+        return _parse_cards_selectolax(page)
+    return _parse_cards_bs4(page, HTML_BACKEND)
+
+
+CATEGORIES_JSON = """
+{
   "0": {
     "id": 0,
     "name": "عقارات",
@@ -650,14 +865,226 @@ def get_category_details(key: str):
     "index": 8
   }
 }
+"""
+
+
+@cache
+def _categories() -> dict[str, dict]:
+    return json.loads(CATEGORIES_JSON)
+
+
+def get_category_details(key: str):
+    return _categories().get(key, None)
+
+
+_NEXT_DATA_TAG = re.compile(rb'id="__NEXT_DATA__"[^>]*>')
+_SCRIPT_END = re.compile(rb"</script>")
+
+
+def extract_next_data(page: str | bytes | memoryview) -> str | None:
+    """Contents of the `__NEXT_DATA__` script tag, found by plain string search.
+
+    Bytes-like pages (e.g. slices of a memory-mapped PageCorpus) are searched
+    in place; only the script contents are decoded out of them.
     """
-    categoriesDictionary = json.loads(json_data)
-    return categoriesDictionary.get(key, None)
+    if not isinstance(page, str):
+        tag = _NEXT_DATA_TAG.search(page)
+        if tag is None:
+            return None
+        end = _SCRIPT_END.search(page, tag.end())
+        if end is None:
+            return None
+        return str(memoryview(page)[tag.end() : end.start()], "utf-8")
+    tag = page.find('id="__NEXT_DATA__"')
+    if tag == -1:
+        return None
+    start = page.find(">", tag) + 1
+    end = page.find("</script>", start)
+    if start == 0 or end == -1:
+        return None
+    return page[start:end]
 
 
-def parse_using_json(page: str) -> list[dict]:
+# column order of listing_row_values(); category fields are joined from
+# category_table() per category_id when the frame is built
+ROW_COLUMNS = (
+    "id",
+    "title",
+    "url",
+    "price",
+    "meter_price",
+    "price_2_payments",
+    "price_4_payments",
+    "price_12_payments",
+    "rnpl_monthly_price",
+    "area_sqm",
+    "deed_area",
+    "num_bedrooms",
+    "num_bathrooms",
+    "num_living_rooms",
+    "num_kitchens",
+    "num_rooms",
+    "floor_level",
+    "furnished",
+    "duplex",
+    "ac",
+    "lift",
+    "maid_room",
+    "driver_room",
+    "pool",
+    "basement",
+    "backyard",
+    "playground",
+    "car_entrance",
+    "stairs",
+    "water_availability",
+    "electrical_availability",
+    "drainage_availability",
+    "private_roof",
+    "two_entrances",
+    "special_entrance",
+    "apartment_in_villa",
+    "street_width",
+    "direction",
+    "city",
+    "district",
+    "address",
+    "latitude",
+    "longitude",
+    "category_id",
+    "sale_type",
+    "is_rental",
+    "is_sale",
+    "is_auction",
+    "is_daily_rental",
+    "create_time",
+    "published_at",
+    "last_update",
+    "verified",
+    "boosted",
+    "premium",
+    "has_img",
+    "has_video",
+    "ad_license_number",
+    "deed_number",
+    "rega_licensed",
+    "plan_no",
+    "parcel_no",
+    "user_verified",
+    "company_name",
+    "user_paid_tier",
+    "description",
+    "images",
+    "videos",
+)
+
+
+def listing_row_values(listing_data: dict) -> tuple:
+    """Flat row of one Apollo `ElasticWebListing` entry, in ROW_COLUMNS order."""
+    get = listing_data.get
+    category_info = get_category_details(str(get("category")))
+
+    if category_info and category_info.get("ga_listing_type") == "daily":
+        sale_type = "daily"
+    elif category_info and category_info.get("is_rent"):
+        sale_type = "rent"
+    elif get("is_auction"):
+        sale_type = "auction"
+    else:
+        sale_type = "sale"
+
+    location = get("location", {})
+    user_info = get("user", {})
+    videos = get("videos") or []
+    return (
+        get("id"),
+        get("title"),
+        "https://sa.aqar.fm" + get("path", ""),
+        get("price"),
+        get("meter_price"),
+        get("price_2_payments"),
+        get("price_4_payments"),
+        get("price_12_payments"),
+        get("rnpl_monthly_price"),
+        get("area"),
+        get("deed_area"),
+        get("beds"),
+        get("wc"),
+        get("livings"),
+        get("ketchen"),
+        get("rooms"),
+        get("fl"),
+        bool(get("furnished")),
+        bool(get("duplex")),
+        bool(get("ac")),
+        bool(get("lift")),
+        bool(get("maid")),
+        bool(get("driver")),
+        bool(get("pool")),
+        bool(get("basement")),
+        bool(get("backyard")),
+        bool(get("playground")),
+        bool(get("car_entrance")),
+        bool(get("stairs")),
+        bool(get("water_availability")),
+        bool(get("electrical_availability")),
+        bool(get("drainage_availability")),
+        bool(get("private_roof")),
+        bool(get("two_entrances")),
+        bool(get("special_entrance")),
+        bool(get("apartment_in_villa")),
+        get("street_width"),
+        get("direction"),
+        get("city"),
+        get("district"),
+        get("address"),
+        location.get("lat"),
+        location.get("lng"),
+        get("category"),
+        sale_type,
+        sale_type == "rent",
+        sale_type == "sale",
+        sale_type == "auction",
+        sale_type == "daily",
+        get("create_time"),
+        get("published_at"),
+        get("last_update"),
+        get("verified"),
+        get("boosted"),
+        get("premium"),
+        get("has_img"),
+        get("has_video"),
+        get("ad_license_number"),
+        get("deed_number"),
+        get("rega_licensed"),
+        get("plan_no"),
+        get("parcel_no"),
+        user_info.get("iam_verified") if user_info else None,
+        user_info.get("company_name") if user_info else None,
+        user_info.get("paid") if user_info else None,
+        get("content"),
+        get("imgs", []),
+        [
+            {"video": video.get("video"), "thumbnail": video.get("thumbnail")}
+            for video in videos
+            if video
+        ],
+    )
+
+
+def build_listing_row(listing_data: dict) -> dict:
+    """Flat row of one Apollo `ElasticWebListing` entry."""
+    return dict(zip(ROW_COLUMNS, listing_row_values(listing_data)))
+
+
+def parse_using_json(
+    page: str | bytes | memoryview | PageBody, index: DedupeIndex | None = None
+) -> list[dict]:
     """parses the page content using embedded JSON data
 
+    Listings that `index` reports as unchanged (same content digest, see
+    drop_unchanged) are skipped.
+
 
     Input JSON EXAMPLE:
                 "ElasticWebListing:6490057": {
@@ -849,14 +1276,31 @@ def parse_using_json(page: str) -> list[dict]:
                     "rega_meter_price": null
                 },
     """
-    output = []
-    soup = BeautifulSoup(page, "html.parser")
-    script_tag = soup.find("script", id="__NEXT_DATA__")
-    if not script_tag:
+    page = page_content(page)
+    listings = page_listings(page)
+    if listings is None:
         return parse_category_page(page)
+    with stage("row build"):
+        rows = [listing_row_values(listing_data) for listing_data in listings]
+    return [dict(zip(ROW_COLUMNS, row)) for row in drop_unchanged(rows, index)]
+
+
+def page_listings(
+    page: str | bytes | memoryview, seen: set[int] | None = None
+) -> list[dict] | None:
+    """Apollo listing entries of a page, or None if it has no `__NEXT_DATA__`.
+
+    Listings whose id is in `seen` are left out (ids of listings kept are
+    added to it).
+    """
+    with stage("extract __NEXT_DATA__"):
+        next_data = extract_next_data(page)
+    if next_data is None:
+        return None
 
     try:
-        data = json.loads(script_tag.string)
+        with stage("json decode"):
+            data = json.loads(next_data)
         listing_ids_parent = data["props"]["pageProps"]["__APOLLO_STATE__"][
             "ROOT_QUERY"
         ]["Web"]
@@ -867,125 +1311,20 @@ def parse_using_json(page: str) -> list[dict]:
             if key.startswith('find({"from":') and key.endswith("})")
         )
         listing_ids = listing_ids_parent[listing_ids_key]["listings"]
-
-        for listing_id in listing_ids:
-            listing_ref = (
-                listing_id.get("__ref") if isinstance(listing_id, dict) else listing_id
-            )
-            listing_data = data["props"]["pageProps"]["__APOLLO_STATE__"].get(
-                listing_ref, {}
-            )
-            category_info = get_category_details(str(listing_data.get("category")))
-
-            def get_sale_type():
-                if category_info:
-                    if category_info.get("ga_listing_type") == "daily":
-                        return "daily"
-                    if category_info.get("is_rent"):
-                        return "rent"
-                if listing_data.get("is_auction"):
-                    return "auction"
-                return "sale"
-
-            dict_item = {}
-            dict_item["id"] = listing_data.get("id")
-            dict_item["title"] = listing_data.get("title")
-            dict_item["url"] = "https://sa.aqar.fm" + listing_data.get("path", "")
-            dict_item["price"] = listing_data.get("price")
-            dict_item["meter_price"] = listing_data.get("meter_price")
-            dict_item["price_2_payments"] = listing_data.get("price_2_payments")
-            dict_item["price_4_payments"] = listing_data.get("price_4_payments")
-            dict_item["price_12_payments"] = listing_data.get("price_12_payments")
-            dict_item["rnpl_monthly_price"] = listing_data.get("rnpl_monthly_price")
-
-            dict_item["area_sqm"] = listing_data.get("area")
-            dict_item["deed_area"] = listing_data.get("deed_area")
-            dict_item["num_bedrooms"] = listing_data.get("beds")
-            dict_item["num_bathrooms"] = listing_data.get("wc")
-            dict_item["num_living_rooms"] = listing_data.get("livings")
-            dict_item["num_kitchens"] = listing_data.get("ketchen")
-            dict_item["num_rooms"] = listing_data.get("rooms")
-            dict_item["floor_level"] = listing_data.get("fl")
-            dict_item["furnished"] = bool(listing_data.get("furnished"))
-            dict_item["duplex"] = bool(listing_data.get("duplex"))
-            dict_item["ac"] = bool(listing_data.get("ac"))
-            dict_item["lift"] = bool(listing_data.get("lift"))
-            dict_item["maid_room"] = bool(listing_data.get("maid"))
-            dict_item["driver_room"] = bool(listing_data.get("driver"))
-            dict_item["pool"] = bool(listing_data.get("pool"))
-            dict_item["basement"] = bool(listing_data.get("basement"))
-            dict_item["backyard"] = bool(listing_data.get("backyard"))
-            dict_item["playground"] = bool(listing_data.get("playground"))
-            dict_item["car_entrance"] = bool(listing_data.get("car_entrance"))
-            dict_item["stairs"] = bool(listing_data.get("stairs"))
-
-            dict_item["water_availability"] = bool(
-                listing_data.get("water_availability")
-            )
-            dict_item["electrical_availability"] = bool(
-                listing_data.get("electrical_availability")
-            )
-            dict_item["drainage_availability"] = bool(
-                listing_data.get("drainage_availability")
-            )
-            dict_item["private_roof"] = bool(listing_data.get("private_roof"))
-            dict_item["two_entrances"] = bool(listing_data.get("two_entrances"))
-            dict_item["special_entrance"] = bool(listing_data.get("special_entrance"))
-            dict_item["apartment_in_villa"] = bool(
-                listing_data.get("apartment_in_villa")
-            )
-            dict_item["street_width"] = listing_data.get("street_width")
-            dict_item["direction"] = listing_data.get("direction")
-            dict_item["city"] = listing_data.get("city")
-            dict_item["district"] = listing_data.get("district")
-            dict_item["address"] = listing_data.get("address")
-            dict_item["latitude"] = listing_data.get("location", {}).get("lat")
-            dict_item["longitude"] = listing_data.get("location", {}).get("lng")
-
-            dict_item["category"] = category_info
-            sale_type = get_sale_type()
-            dict_item["sale_type"] = sale_type
-
-            dict_item["is_rental"] = sale_type == "rent"
-            dict_item["is_sale"] = sale_type == "sale"
-            dict_item["is_auction"] = sale_type == "auction"
-            dict_item["is_daily_rental"] = sale_type == "daily"
-
-            dict_item["create_time"] = listing_data.get("create_time")
-            dict_item["published_at"] = listing_data.get("published_at")
-            dict_item["last_update"] = listing_data.get("last_update")
-            dict_item["verified"] = listing_data.get("verified")
-            dict_item["boosted"] = listing_data.get("boosted")
-            dict_item["premium"] = listing_data.get("premium")
-            dict_item["has_img"] = listing_data.get("has_img")
-            dict_item["has_video"] = listing_data.get("has_video")
-
-            dict_item["ad_license_number"] = listing_data.get("ad_license_number")
-            dict_item["deed_number"] = listing_data.get("deed_number")
-            dict_item["rega_licensed"] = listing_data.get("rega_licensed")
-            dict_item["plan_no"] = listing_data.get("plan_no")
-            dict_item["parcel_no"] = listing_data.get("parcel_no")
-
-            user_info = listing_data.get("user", {})
-            dict_item["user_verified"] = (
-                user_info.get("iam_verified") if user_info else None
+        page_listings = [
+            data["props"]["pageProps"]["__APOLLO_STATE__"].get(
+                listing_id.get("__ref") if isinstance(listing_id, dict) else listing_id,
+                {},
             )
-            dict_item["company_name"] = (
-                user_info.get("company_name") if user_info else None
-            )
-            dict_item["user_paid_tier"] = user_info.get("paid") if user_info else None
-
-            dict_item["description"] = listing_data.get("content")
-            dict_item["images"] = listing_data.get("imgs", [])
-            videos = listing_data.get("videos") or []
-            dict_item["videos"] = [video.get("video") for video in videos if video]
-
-            output.append(dict_item)
-
+            for listing_id in listing_ids
+        ]
     except (json.JSONDecodeError, KeyError) as e:
         print(f"Error parsing JSON data: {e}")
+        return []
 
-    return output
+    return drop_seen(
+        page_listings, (listing.get("id") for listing in page_listings), seen
+    )
 
 
 def flatten_dict(d: dict, parent_key: str = "", sep: str = "_") -> dict:
@@ -1000,47 +1339,489 @@ def flatten_dict(d: dict, parent_key: str = "", sep: str = "_") -> dict:
     return dict(items)
 
 
-def parse_all_category_pages(pages: list[str]) -> list[dict]:
-    all_listings = []
+@cache
+def category_table() -> pd.DataFrame:
+    """Flattened category fields (`category_*` columns) indexed by category id."""
+    rows = [flatten_dict(category, "category") for category in _categories().values()]
+    return pd.DataFrame(rows).set_index("category_id")
+
+
+def build_listings_frame(listings: ListingColumns | list[dict]) -> pd.DataFrame:
+    """Build the flat listings frame in one go and join the category fields."""
+    with stage("DataFrame build"):
+        if isinstance(listings, ListingColumns):
+            df = listings.to_frame()
+        else:
+            df = pd.DataFrame(listings)
+    with stage("flatten"):
+        if "category_id" not in df.columns:
+            df["category_id"] = None
+        df["category_id"] = df["category_id"].astype("Int64")
+        return df.join(category_table(), on="category_id")
+
+
+_ID = ROW_COLUMNS.index("id")
+_LAST_UPDATE = ROW_COLUMNS.index("last_update")
+
+
+def row_digest(row: tuple) -> str:
+    """Content digest of a row, the scraper's dedupe index key."""
+    return hashlib.blake2b(repr(row).encode(), digest_size=16).hexdigest()
+
+
+def drop_unchanged(rows: list[tuple], index: DedupeIndex | None) -> list[tuple]:
+    """Rows that `index` does not have with the same content.
+
+    Catches edits that keep the `last_update`. The kept rows' `(id,
+    last_update, digest)` entries are queued in `index.pending`, to be
+    recorded once the rows are written.
+    """
+    if index is None or not rows:
+        return rows
+    entries = [(row[_ID], row[_LAST_UPDATE], row_digest(row)) for row in rows]
+    unchanged = index.unchanged(entries)
+    kept = []
+    for row, entry in zip(rows, entries):
+        if row[_ID] not in unchanged:
+            kept.append(row)
+            index.pending.append(entry)
+    return kept
+
+
+def page_digest(page: str | bytes | memoryview) -> str:
+    """Content hash of a page, the parse cache key."""
+    body = page.encode("utf-8") if isinstance(page, str) else page
+    # sha256 is hardware-accelerated on most CPUs, faster here than blake2b
+    return hashlib.sha256(body).hexdigest()
+
+
+def _page_rows(
+    digest: str, parser_version: int, page: str | bytes | memoryview
+) -> bytes:
+    """Every row of a page, pickled; `digest` and `parser_version` are the
+    cache key.
+
+    joblib unpickles results with the pure Python unpickler, so the rows
+    are handed to it as one bytes object and unpickled by the C one.
+    """
+    _parse_state.outcome = "miss"
+    return pickle.dumps(parse_page_rows(page), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def parse_page_rows(
+    page: str | bytes | memoryview | PageBody,
+    use_cache: bool = False,
+    seen: set[int] | None = None,
+) -> tuple[list[tuple], list[dict]]:
+    """Rows of one page: ROW_COLUMNS tuples, or the HTML fallback's dicts.
+
+    With `use_cache`, the rows of a page whose content and PARSER_VERSION
+    were seen before come from the parse cache instead of being parsed.
+    Listings whose id is in `seen` are skipped, see page_listings().
+    A PageBody is decompressed here, when it is parsed.
+    """
+    page = page_content(page)
+    if use_cache:
+        init()
+        _parse_state.outcome = "hit"
+        rows, fallback_rows = pickle.loads(
+            _cached_page_rows(page_digest(page), PARSER_VERSION, page)
+        )
+        if _parse_state.outcome == "hit":
+            PARSE_CACHE_HITS.inc()
+        else:
+            PARSE_CACHE_MISSES.inc()
+        return drop_seen(rows, (row[_ID] for row in rows), seen), fallback_rows
+
+    listings = page_listings(page, seen)
+    if listings is None:
+        return [], parse_category_page(page)
+    with stage("row build"):
+        return [listing_row_values(listing_data) for listing_data in listings], []
+
+
+def trim_parse_cache(bytes_limit: int | str = PARSE_CACHE_BYTES) -> None:
+    """Evict the least recently used parse results beyond `bytes_limit`."""
+    init()
+    parse_memory.reduce_size(bytes_limit=bytes_limit)
+
+
+def parse_all_category_pages(
+    pages: list[str | PageBody],
+    index: DedupeIndex | None = None,
+    use_cache: bool = True,
+    seen: set[int] | None = None,
+) -> ListingColumns:
+    """Parse every page straight into typed column buffers.
+
+    Unchanged pages are served from the parse cache unless `use_cache` is
+    False. With a `seen` set, a listing that an earlier page already had
+    (the results shifted during the crawl) is skipped before its row is
+    built.
+    """
+    columns = ListingColumns(ROW_COLUMNS)
+    append = columns.append
     for page in pages:
-        listings = parse_using_json(page)
-        all_listings.extend(listings)
-    return all_listings
+        start = time.perf_counter()
+        rows, fallback_rows = parse_page_rows(page, use_cache, seen)
+        rows = drop_unchanged(rows, index)
+        for row in rows:
+            append(row)
+        columns.extend_rows(fallback_rows)
+        PARSE_SECONDS.observe(time.perf_counter() - start)
+        LISTINGS_PER_PAGE.observe(len(rows) + len(fallback_rows))
+    if use_cache:
+        trim_parse_cache()
+    return columns
+
+
+# per-process state of parse_page_corpus() workers
+_worker_corpus: PageCorpus | None = None
+_worker_use_cache = False
+
+
+def _open_worker_corpus(path: Path, use_cache: bool) -> None:
+    global _worker_corpus, _worker_use_cache
+    _worker_corpus = PageCorpus(path)
+    _worker_use_cache = use_cache
+
+
+def _parse_corpus_pages(
+    start: int, stop: int
+) -> list[tuple[list[tuple], list[dict], float, str | None]]:
+    results = []
+    for i in range(start, stop):
+        page_start = time.perf_counter()
+        _parse_state.outcome = None
+        rows, fallback_rows = parse_page_rows(_worker_corpus[i], _worker_use_cache)
+        seconds = time.perf_counter() - page_start
+        results.append((rows, fallback_rows, seconds, _parse_state.outcome))
+    return results
+
+
+def parse_page_corpus(
+    path: Path,
+    index: DedupeIndex | None = None,
+    max_workers: int | None = None,
+    chunk_pages: int = 32,
+    use_cache: bool = True,
+    seen: set[int] | None = None,
+) -> ListingColumns:
+    """Parse a page corpus file (see corpus.py) across worker processes.
+
+    Every worker maps the corpus itself and parses its pages in place, so
+    the pages are neither pickled to the workers nor copied into their
+    heaps. Rows come back in page order. As in parse_all_category_pages,
+    unchanged pages are served from the parse cache unless `use_cache` is
+    False; bump PARSER_VERSION after changing the parser. Listings in
+    `seen`, or unchanged according to `index`, are dropped as the rows come
+    back, since the workers do not share them.
+    """
+    with PageCorpus(path) as corpus:
+        page_count = len(corpus)
+    starts = range(0, page_count, chunk_pages)
+    stops = [min(start + chunk_pages, page_count) for start in starts]
+
+    columns = ListingColumns(ROW_COLUMNS)
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_open_worker_corpus,
+        initargs=(path, use_cache),
+    ) as executor:
+        for results in executor.map(_parse_corpus_pages, starts, stops):
+            for rows, fallback_rows, seconds, outcome in results:
+                rows = drop_seen(rows, (row[_ID] for row in rows), seen)
+                rows = drop_unchanged(rows, index)
+                for row in rows:
+                    columns.append(row)
+                columns.extend_rows(fallback_rows)
+                PARSE_SECONDS.observe(seconds)
+                LISTINGS_PER_PAGE.observe(len(rows) + len(fallback_rows))
+                if outcome == "hit":
+                    PARSE_CACHE_HITS.inc()
+                elif outcome == "miss":
+                    PARSE_CACHE_MISSES.inc()
+    if use_cache:
+        trim_parse_cache()
+    return columns
+
+
+def merge_raw_listings(delta: pd.DataFrame, path: Path) -> pd.DataFrame:
+    """The raw listings at `path` with the rows of `delta` upserted by `id`
+    (or `url` when there is no id)."""
+    if not path.exists():
+        return delta
+    full = read_listings_csv(path)
+
+    def keys(df: pd.DataFrame) -> pd.Series:
+        return df["id"].astype("string").fillna(df["url"].astype("string"))
+
+    kept = full[~keys(full).isin(keys(delta))]
+    return conform_listings(pd.concat([kept, delta], ignore_index=True))
+
+
+def merge_raw_records(delta: pd.DataFrame, path: Path) -> pd.DataFrame:
+    """The raw listing records of the JSON file at `path` with the rows of
+    `delta` upserted like merge_raw_listings().
+
+    The records are merged as they are, so list and dict cells (`images`,
+    `videos`) stay lists and dicts rather than the CSV's text.
+    """
+    records = json.loads(delta.to_json(orient="records", force_ascii=False))
+    if not path.exists():
+        return pd.DataFrame(records)
+
+    def key(record: dict) -> int | str | None:
+        listing_id = record.get("id")
+        return record.get("url") if listing_id is None else int(listing_id)
+
+    delta_keys = {key(record) for record in records}
+    full = json.loads(path.read_text(encoding="utf-8"))
+    kept = [record for record in full if key(record) not in delta_keys]
+    return pd.DataFrame(kept + records)
 
 
 def get_all_category_pages(
     rooturl: str = "https://sa.aqar.fm/%D8%B9%D9%82%D8%A7%D8%B1%D8%A7%D8%AA/",
-) -> list[str]:
-    all_urls = [rooturl + f"{i}" for i in range(1, 9999)]
+    fetch: Callable[[str], PageBody | str | None] | None = None,
+    refetch: Callable[[str], PageBody | str | None] | None = None,
+    page_nums: Iterable[int] | None = None,
+    tracker: DriftTracker | None = None,
+    fetched: set[int] | None = None,
+) -> list[PageBody | str]:
+    """Fetch every results page (or only `page_nums`), in page order.
+
+    The pages are checked for pagination drift as they arrive (see
+    pagination.py), with `tracker` if given. With `refetch`, the pages that
+    now hold listings the crawl skipped over are fetched again with it and
+    appended. The numbers of the pages that came from the network rather
+    than the page cache are added to `fetched`, if given.
+    """
+    page_nums = range(1, 9999) if page_nums is None else page_nums
+    all_urls = [rooturl + f"{i}" for i in page_nums]
+    fetch = fetch or fetch_data
+    tracker = tracker or DriftTracker()
+    init()
+
+    def fetch_page(url: str) -> str | None:
+        FETCH_QUEUE_DEPTH.dec()
+        _fetch_state.outcome = "hit"
+        start = time.perf_counter()
+        try:
+            with stage("fetch"):
+                page = fetch(url)
+            tracker.observe(int(url.rsplit("/", 1)[-1]), page)
+            if isinstance(page, PageBody):
+                # pages are kept compressed until parsed
+                page.release_content()
+            return page
+        finally:
+            WORKER_BUSY_SECONDS.inc(time.perf_counter() - start)
+            if _fetch_state.outcome == "hit":
+                PAGE_CACHE_HITS.inc()
+            elif _fetch_state.outcome == "miss":
+                PAGE_CACHE_MISSES.inc()
+                if fetched is not None:
+                    fetched.add(int(url.rsplit("/", 1)[-1]))
 
     all_pages = []
+    FETCH_QUEUE_DEPTH.set(len(all_urls))
+    busy_before = WORKER_BUSY_SECONDS.value
+    start = time.perf_counter()
     try:
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            for page in executor.map(fetch_data, all_urls):
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for page in executor.map(fetch_page, all_urls):
                 if page:
                     all_pages.append(page)
     except AssertionError as e:
         print(f"Stopped fetching more pages due to error: {e}")
+    busy = WORKER_BUSY_SECONDS.value - busy_before
+    WORKER_UTILIZATION.set(busy / (MAX_WORKERS * (time.perf_counter() - start)))
+
+    gaps = tracker.gaps()
+    PAGINATION_GAPS.inc(sum(gaps.values()))
+    if tracker.duplicates or gaps:
+        print(
+            f"Pagination drift: {tracker.duplicates} listings fetched twice, "
+            f"{sum(gaps.values())} skipped over before pages {sorted(gaps)}"
+        )
+    if refetch:
+        refetched = set()
+        for gap_page in sorted(gaps):
+            # targets follow the list as it keeps moving during the refetch
+            for page_num in tracker.refetch_pages(gap_page):
+                if page_num in refetched:
+                    continue
+                refetched.add(page_num)
+                with stage("fetch"):
+                    page = refetch(rooturl + f"{page_num}")
+                PAGES_REFETCHED.inc()
+                tracker.observe_refetch(page)
+                if isinstance(page, PageBody):
+                    page.release_content()
+                if page:
+                    all_pages.append(page)
     return all_pages
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape aqar.fm listings")
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="only emit listings that are new or updated since previous runs",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        default=raw_dir / "metrics.json",
+        help="where to write run metrics: Prometheus text for *.prom, else JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the run and write a per-stage report next to the outputs",
+    )
+    parser.add_argument(
+        "--save-corpus",
+        action="store_true",
+        help=f"also save the fetched pages to {corpus_path} for later re-parsing",
+    )
+    parser.add_argument(
+        "--from-corpus",
+        action="store_true",
+        help=f"re-parse the pages saved in {corpus_path} instead of fetching",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="parser processes for --from-corpus (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help="parse every page even if its content and the parser are unchanged",
+    )
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help=f"log changed listing fields to the history log ({default_history_path})",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help=f"also upsert the listings into the SQLite store ({default_store_path})",
+    )
+    parser.add_argument(
+        "--revisit",
+        type=int,
+        metavar="REQUESTS",
+        help="only fetch the pages most likely to hold fresh listings, "
+        "as many as REQUESTS (see revisit.py)",
+    )
+    args = parser.parse_args()
+    init()
 
-    rooturl = "https://sa.aqar.fm/%D8%B9%D9%82%D8%A7%D8%B1%D8%A7%D8%AA/"
-    all_urls = [rooturl + f"{i}" for i in range(1, 9999)]
-
-    all_pages = get_all_category_pages(rooturl)
+    with profile_run(raw_dir, "main", enabled=args.profile):
+        rooturl = "https://sa.aqar.fm/%D8%B9%D9%82%D8%A7%D8%B1%D8%A7%D8%AA/"
+        all_urls = [rooturl + f"{i}" for i in range(1, 9999)]
 
-    all_listings = parse_all_category_pages(all_pages)
-    all_listings_flat = [flatten_dict(listing) for listing in all_listings]
+        index = DedupeIndex("scraper") if args.skip_unchanged else None
+        if args.from_corpus:
+            all_listings = parse_page_corpus(
+                corpus_path,
+                index,
+                args.workers,
+                use_cache=not args.no_parse_cache,
+                seen=set(),
+            )
+        else:
+            scheduler = RevisitScheduler()
+            tracker = DriftTracker()
+            # pages served from the page cache are no new visit
+            fetched = set()
+            if args.revisit is not None:
+                page_nums = scheduler.schedule(args.revisit)
+                print(f"Revisiting pages {page_nums}")
+                # fresh copies, within the budget: no cache, no refetching
+                all_pages = get_all_category_pages(
+                    rooturl,
+                    fetch=partial(fetch_data, use_cache=False),
+                    page_nums=page_nums,
+                    tracker=tracker,
+                    fetched=fetched,
+                )
+            else:
+                all_pages = get_all_category_pages(
+                    rooturl,
+                    refetch=partial(fetch_data, use_cache=False),
+                    tracker=tracker,
+                    fetched=fetched,
+                )
+            if args.save_corpus:
+                corpus = write_corpus(map(page_content, all_pages), corpus_path)
+                print(f"Pages saved to {corpus}")
+            all_listings = parse_all_category_pages(
+                all_pages, index, use_cache=not args.no_parse_cache, seen=set()
+            )
+        df = build_listings_frame(all_listings)
+        del all_listings
+        if not args.from_corpus:
+            with stage("revisit"):
+                last_updates = {
+                    int(i): None if pd.isna(u) else int(u)
+                    for i, u in zip(df["id"], df["last_update"])
+                    if not pd.isna(i)
+                }
+                visited = {
+                    page_num: window
+                    for page_num, window in tracker.windows.items()
+                    if page_num in fetched
+                }
+                fresh = scheduler.record(visited, last_updates)
+                print(f"{fresh} fresh listings on {len(visited)} fetched pages")
+                scheduler.close()
 
-    df = pd.DataFrame(all_listings)
-    df_flat = pd.DataFrame(all_listings_flat)
+        # runs that only see some listings write them to the delta files and
+        # merge them into the full raw files
+        delta_run = args.skip_unchanged or args.revisit is not None
+        name = "aqar_fm_listings.delta" if delta_run else "aqar_fm_listings"
+        with stage("write"):
+            df.to_json(
+                raw_dir / f"{name}.json", orient="records", force_ascii=False, indent=2
+            )
+            if delta_run:
+                records = merge_raw_records(df, raw_dir / "aqar_fm_listings.json")
+                records.to_json(
+                    raw_dir / "aqar_fm_listings.json",
+                    orient="records",
+                    force_ascii=False,
+                    indent=2,
+                )
+                del records
+            df = conform_listings(df)
+            validate_listings(df)
+            df.to_csv(raw_dir / f"{name}.csv", index=False, lineterminator="\n")
+            if delta_run:
+                full = merge_raw_listings(df, raw_dir / "aqar_fm_listings.csv")
+                full.to_csv(
+                    raw_dir / "aqar_fm_listings.csv", index=False, lineterminator="\n"
+                )
+                print(f"Merged {len(df)} listings into {len(full)} raw listings")
+                del full
+        if args.store:
+            with stage("store"):
+                store = ListingStore()
+                written = store.upsert(df, "raw_listings")
+                print(f"Upserted {written} listings into {store.path}")
+                store.close()
+        if args.history:
+            with stage("history"):
+                log = HistoryLog()
+                print(f"Logged {log.record(df)} changed fields to {log.path}")
+                log.close()
+        if index:
+            index.record(index.pending)
 
-    df_flat.to_csv(raw_dir / "aqar_fm_listings.csv", index=False, lineterminator="\n")
-    df.to_json(
-        raw_dir / "aqar_fm_listings.json",
-        orient="records",
-        force_ascii=False,
-        indent=2,
-    )
+    print(f"Metrics saved to {registry.write(args.metrics)}")
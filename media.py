@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+from metrics import registry
+
+if TYPE_CHECKING:
+    import httpx
+    import pandas as pd
+else:
+    httpx = lazy_import("httpx")
+    pd = lazy_import("pandas")
+
+media_dir = Path("./data") / "media"
+manifest_path = media_dir / "manifest.csv"
+# downloaded files, stored once per content hash
+objects_dir = media_dir / "objects"
+# partial downloads, resumed with a Range request on the next attempt
+partial_dir = media_dir / "partial"
+
+# listing photos are served resized; `size` is "<width>x0"
+IMAGE_URL = "https://images.aqar.fm/webp/{size}/props/{name}"
+THUMBNAIL_SIZE = "350x0"
+FULL_SIZE = "1080x0"
+
+MAX_CONCURRENCY = 16
+CHUNK_BYTES = 1 << 16
+
+MANIFEST_COLUMNS = ["name", "kind", "url", "listings", "sha256", "path"]
+
+MEDIA_DOWNLOADS = registry.counter(
+    "aqar_media_downloads_total", "Media files downloaded to the object store"
+)
+MEDIA_BYTES = registry.counter(
+    "aqar_media_bytes_total", "Media bytes received, resumed ranges included"
+)
+MEDIA_RESUMED = registry.counter(
+    "aqar_media_resumed_total", "Media downloads resumed from a partial file"
+)
+
+
+def _media_names(values: pd.Series, key: str | None = None) -> pd.Series:
+    """Media names of a list column, one per row, with the row's listing id.
+
+    With `key`, the items are dicts (`videos`: video and thumbnail) and
+    their `key` is taken.
+    """
+    from clean_data import clean_list_field
+
+    # cleaned frames hold lists, raw CSVs their string form
+    names = values.map(lambda v: v if isinstance(v, list) else clean_list_field(v))
+    names = names.explode().dropna()
+    if key is not None:
+
+        def item_name(item):
+            if isinstance(item, dict):
+                return item.get(key)
+            # plain names: video lists from before thumbnails were kept
+            return item if key == "video" else None
+
+        names = names.map(item_name).dropna()
+    return names[names.astype(str) != ""].astype(str)
+
+
+def build_manifest(
+    df: pd.DataFrame,
+    full: bool = False,
+    video_url: str | None = None,
+    previous: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """One row per distinct media file referenced by the listings of `df`.
+
+    `listings` counts the listings that reference a file; reposted listings
+    share their files, so each is fetched once. Images and video thumbnails
+    are photos served like the listing photos, and point to thumbnails
+    unless `full`. The site's video URLs are not in the listing data, so
+    videos get a URL only from a `video_url` template (`{name}` is the
+    video id) and are otherwise listed without one. Hashes and paths of
+    files already downloaded are carried over from `previous`.
+    """
+    frames = []
+    size = FULL_SIZE if full else THUMBNAIL_SIZE
+    for column, key, kind in [
+        ("images", None, "image"),
+        ("videos", "thumbnail", "video_thumbnail"),
+        ("videos", "video", "video"),
+    ]:
+        if column not in df.columns:
+            continue
+        names = _media_names(df.set_index("id")[column], key)
+        counts = names.reset_index().drop_duplicates().groupby(column).size()
+        frame = pd.DataFrame(
+            {"name": counts.index, "kind": kind, "listings": counts.to_numpy()}
+        )
+        if kind != "video":
+            frame["url"] = [IMAGE_URL.format(size=size, name=n) for n in frame["name"]]
+        else:
+            frame["url"] = (
+                [video_url.format(name=n) for n in frame["name"]] if video_url else None
+            )
+        frames.append(frame)
+
+    manifest = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    manifest = manifest.reindex(columns=MANIFEST_COLUMNS).astype(
+        {"sha256": object, "path": object}
+    )
+    if previous is not None and not previous.empty:
+        done = previous.dropna(subset=["sha256"]).set_index("url")
+        manifest["sha256"] = manifest["url"].map(done["sha256"])
+        manifest["path"] = manifest["url"].map(done["path"])
+    return manifest.sort_values(
+        ["listings", "name"], ascending=[False, True], ignore_index=True
+    )
+
+
+def _object_path(digest: str, name: str) -> Path:
+    return objects_dir / digest[:2] / (digest + Path(name).suffix)
+
+
+async def _download(
+    client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str, name: str
+) -> tuple[str, str] | None:
+    """Fetch one file into the object store; `(sha256, path)` or None."""
+    async with semaphore:
+        part = partial_dir / (hashlib.sha256(url.encode()).hexdigest() + ".part")
+        digest = hashlib.sha256()
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"range": f"bytes={offset}-"} if offset else {}
+        try:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 416:
+                    # the partial file already holds the whole body
+                    pass
+                elif response.status_code == 206 and offset:
+                    MEDIA_RESUMED.inc()
+                elif response.status_code == 200:
+                    offset = 0
+                else:
+                    print(f"Skipping {url}: HTTP {response.status_code}")
+                    return None
+                if offset:
+                    with open(part, "rb") as f:
+                        while chunk := f.read(CHUNK_BYTES):
+                            digest.update(chunk)
+                with open(part, "ab" if offset else "wb") as f:
+                    if response.status_code != 416:
+                        # written as received, so an interrupted body is
+                        # kept up to the last byte that arrived
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+                            digest.update(chunk)
+                            MEDIA_BYTES.inc(len(chunk))
+        except httpx.HTTPError as e:
+            # the partial file is kept and resumed on the next run
+            print(f"Failed to download {url}: {e!r}")
+            return None
+
+        sha256 = digest.hexdigest()
+        path = _object_path(sha256, name)
+        if path.exists():
+            part.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(part, path)
+        MEDIA_DOWNLOADS.inc()
+        return sha256, str(path)
+
+
+async def _download_all(
+    manifest: pd.DataFrame, concurrency: int
+) -> list[tuple[str, str] | None]:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        limits=limits, timeout=30, follow_redirects=True
+    ) as client:
+        return await asyncio.gather(
+            *(
+                _download(client, semaphore, url, name)
+                for url, name in zip(manifest["url"], manifest["name"])
+            )
+        )
+
+
+def download_media(
+    manifest: pd.DataFrame, concurrency: int = MAX_CONCURRENCY
+) -> pd.DataFrame:
+    """Download the manifest's files not downloaded yet; returns the manifest
+    with their `sha256` and `path` filled in.
+
+    At most `concurrency` requests run at once. Interrupted downloads are
+    resumed from their partial file; files are stored under their content
+    hash, so identical files behind different names are stored once.
+    """
+    partial_dir.mkdir(parents=True, exist_ok=True)
+    manifest = manifest.copy()
+    stored = manifest["path"].map(lambda p: isinstance(p, str) and Path(p).exists())
+    missing = manifest["url"].notna() & ~stored
+    # rows sharing a URL share its partial file: download each URL once
+    todo = manifest[missing].drop_duplicates("url")
+    results = asyncio.run(_download_all(todo, concurrency))
+    done = {
+        url: result for url, result in zip(todo["url"], results) if result is not None
+    }
+    for row, url in manifest.loc[missing, "url"].items():
+        if url in done:
+            manifest.loc[row, ["sha256", "path"]] = done[url]
+    return manifest
+
+
+if __name__ == "__main__":
+    from clean_data import cleaned_state_path
+
+    parser = argparse.ArgumentParser(description="Download listing images and videos")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help=f"download full-size images ({FULL_SIZE}) instead of thumbnails",
+    )
+    parser.add_argument(
+        "--video-url",
+        help="URL template of video files, e.g. https://host/{name}.mp4",
+    )
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument(
+        "--manifest-only",
+        action="store_true",
+        help="only write the manifest, download nothing",
+    )
+    args = parser.parse_args()
+
+    df = pd.read_pickle(cleaned_state_path)
+    previous = pd.read_csv(manifest_path) if manifest_path.exists() else None
+    manifest = build_manifest(df, args.full, args.video_url, previous)
+    references = int(manifest["listings"].sum())
+    print(f"{len(manifest)} distinct media files for {references} references")
+    media_dir.mkdir(parents=True, exist_ok=True)
+    if not args.manifest_only:
+        manifest = download_media(manifest, args.concurrency)
+        print(f"Downloaded {manifest['sha256'].notna().sum()} of {len(manifest)}")
+    manifest.to_csv(manifest_path, index=False)
+    print(f"Manifest saved to {manifest_path}")
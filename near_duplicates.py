@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from itertools import chain
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+TEXT_COLUMNS = ["title", "description"]
+# attributes that must agree (when both listings have them) for a match
+ATTRIBUTE_COLUMNS = ["area_sqm", "num_bedrooms"]
+
+# words per shingle
+SHINGLE_WORDS = 3
+# signature length = BANDS * ROWS_PER_BAND; two listings become candidates
+# when one band of their signatures is identical, which is likely from a
+# Jaccard similarity of about (1 / BANDS) ** (1 / ROWS_PER_BAND) = 0.5
+BANDS = 16
+ROWS_PER_BAND = 4
+# estimated Jaccard similarity needed to confirm a candidate pair
+THRESHOLD = 0.7
+# blocking grid cell in degrees (~1 km); reposts share their coordinates
+CELL_DEGREES = 0.01
+# every pair of an LSH bucket is a candidate; in buckets larger than this,
+# each row is paired with the next BUCKET_WINDOW rows only
+BUCKET_WINDOW = 64
+
+_SEED = 20240601
+# shingles hashed per chunk, bounds the (shingles, permutations) array
+_CHUNK_SHINGLES = 1 << 16
+
+
+def _shingle_hashes(texts: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """uint64 hashes of the word shingles of all texts, and their count per text.
+
+    Words are hashed once; shingle i combines the hashes of words i to
+    i + SHINGLE_WORDS - 1 of the same text. Texts with fewer words are one
+    shingle.
+    """
+    words = [text.lower().split() for text in texts.fillna("").astype(str)]
+    counts = np.array([len(w) for w in words], dtype=np.int64)
+    if not counts.sum():
+        return np.empty(0, dtype=np.uint64), np.zeros(len(texts), dtype=np.int64)
+    hashes = pd.util.hash_array(np.array(list(chain.from_iterable(words)), object))
+
+    word_end = np.repeat(np.cumsum(counts), counts)
+    word_count = np.repeat(counts, counts)
+    position = np.arange(len(hashes))
+    shingles = hashes.copy()
+    with np.errstate(over="ignore"):
+        for k in range(1, SHINGLE_WORDS):
+            following = hashes[np.minimum(position + k, len(hashes) - 1)]
+            combined = shingles * np.uint64(0x100000001B3) ^ following
+            shingles = np.where(position + k < word_end, combined, shingles)
+    first_word = position == word_end - word_count
+    valid = (position + SHINGLE_WORDS <= word_end) | (
+        first_word & (word_count < SHINGLE_WORDS)
+    )
+    text_of = np.repeat(np.arange(len(texts)), counts)[valid]
+    return shingles[valid], np.bincount(text_of, minlength=len(texts))
+
+
+def minhash_signatures(texts: pd.Series) -> np.ndarray:
+    """MinHash signature of the word shingles of each text.
+
+    Returns a (len(texts), BANDS * ROWS_PER_BAND) uint32 array; texts
+    without words get all-ones rows. The permutations are multiply-shift
+    hashes, (a * x + b) >> 32 in wrapping 64-bit arithmetic, and the minimum
+    per text is taken with `np.minimum.reduceat`.
+    """
+    perms = BANDS * ROWS_PER_BAND
+    rng = np.random.default_rng(_SEED)
+    a = rng.integers(1, 2**63, size=perms, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, size=perms, dtype=np.uint64)
+
+    shingles, counts = _shingle_hashes(texts)
+    signatures = np.full((len(texts), perms), np.iinfo(np.uint32).max, np.uint32)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    rows = np.flatnonzero(counts)
+    if not len(rows):
+        return signatures
+    chunk_rows = max(1, len(rows) * _CHUNK_SHINGLES // len(shingles))
+    with np.errstate(over="ignore"):
+        for start in range(0, len(rows), chunk_rows):
+            chunk = rows[start : start + chunk_rows]
+            lo, hi = offsets[chunk[0]], offsets[chunk[-1] + 1]
+            # (perms, shingles): the reduction runs along contiguous rows
+            values = (np.outer(a, shingles[lo:hi]) + b[:, None]) >> np.uint64(32)
+            signatures[chunk] = np.minimum.reduceat(
+                values.astype(np.uint32), offsets[chunk] - lo, axis=1
+            ).T
+    return signatures
+
+
+def _blocks(df: pd.DataFrame) -> np.ndarray:
+    """Blocking key codes: category plus the coordinates' grid cell (or district)."""
+    lat = pd.to_numeric(df["latitude"], errors="coerce")
+    lng = pd.to_numeric(df["longitude"], errors="coerce")
+    cell = (
+        (lat // CELL_DEGREES).astype("Int64").astype("string")
+        + ","
+        + (lng // CELL_DEGREES).astype("Int64").astype("string")
+    )
+    if "district" in df.columns:
+        cell = cell.fillna("district:" + df["district"].astype("string"))
+    category = pd.Series("", index=df.index, dtype="string")
+    if "category_en" in df.columns:
+        category = df["category_en"].astype("string").fillna("")
+    return pd.factorize(category + "|" + cell.fillna(""))[0]
+
+
+def _candidate_pairs(
+    signatures: np.ndarray, blocks: np.ndarray, rows: np.ndarray
+) -> np.ndarray:
+    """(row, row) pairs sharing a block and a band of their signatures.
+
+    All pairs of each LSH bucket are candidates, up to BUCKET_WINDOW rows
+    apart within the bucket, so the pairs grow linearly even for very large
+    buckets.
+    """
+    pairs = []
+    for band in range(BANDS):
+        band_rows = signatures[rows, band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND]
+        keys = pd.util.hash_array(
+            np.ascontiguousarray(band_rows).view(f"V{band_rows.shape[1] * 4}").ravel()
+        )
+        keys = pd.util.hash_array(keys ^ blocks[rows].astype(np.uint64))
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        largest = np.diff(np.r_[starts, len(order)]).max(initial=1)
+        # rows `offset` apart in the sorted order, when in the same bucket
+        for offset in range(1, min(largest, BUCKET_WINDOW + 1)):
+            same = sorted_keys[offset:] == sorted_keys[:-offset]
+            pairs.append(
+                np.column_stack(
+                    [rows[order[:-offset][same]], rows[order[offset:][same]]]
+                )
+            )
+    if not pairs:
+        return np.empty((0, 2), dtype=rows.dtype)
+    pairs = np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)
+    # bucket keys are hashes: drop any pair from different blocks
+    return pairs[blocks[pairs[:, 0]] == blocks[pairs[:, 1]]]
+
+
+def listing_signatures(df: pd.DataFrame) -> np.ndarray:
+    """MinHash signatures of the TEXT_COLUMNS of every listing of `df`."""
+    text = pd.Series("", index=df.index, dtype="string")
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            text = text + " " + df[column].astype("string").fillna("")
+    return minhash_signatures(text)
+
+
+def near_duplicate_clusters(
+    df: pd.DataFrame, signatures: np.ndarray | None = None
+) -> pd.Series:
+    """Cluster id of every listing: the smallest id among its near duplicates.
+
+    Listings are near duplicates when the word shingles of their title and
+    description have an estimated Jaccard similarity of at least THRESHOLD,
+    they share a category and grid cell, and their ATTRIBUTE_COLUMNS agree.
+    Candidate pairs come from LSH banding of MinHash signatures within each
+    block, so the work grows with the number of listings rather than the
+    number of pairs. Listings without near duplicates get their own id.
+    `signatures` are the listing_signatures() of `df`, when already known.
+    """
+    ids = pd.to_numeric(df["id"], errors="coerce").astype("Int64")
+    if signatures is None:
+        signatures = listing_signatures(df)
+    has_text = np.flatnonzero((signatures != np.iinfo(np.uint32).max).any(axis=1))
+
+    pairs = _candidate_pairs(signatures, _blocks(df), has_text)
+    first, other = pairs[:, 0], pairs[:, 1]
+    confirmed = (signatures[first] == signatures[other]).mean(axis=1) >= THRESHOLD
+    for column in ATTRIBUTE_COLUMNS:
+        if column in df.columns:
+            values = pd.to_numeric(df[column], errors="coerce").to_numpy(float)
+            a, b = values[first], values[other]
+            confirmed &= np.isnan(a) | np.isnan(b) | (a == b)
+
+    parent = np.arange(len(df))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs[confirmed].tolist():
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    roots = [find(i) for i in range(len(df))]
+    clusters = pd.Series(ids.to_numpy(), index=df.index).groupby(roots).transform("min")
+    return clusters.fillna(ids).astype("Int64").rename("duplicate_cluster")
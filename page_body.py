@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import importlib.util
+import zlib
+from functools import cache
+
+
+def _installed(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+# content codings the fetcher can decode, best first; gzip and deflate come
+# with zlib, brotli and zstd need the `compression` extra (or Python 3.14)
+ENCODINGS = [
+    *(["zstd"] if _installed("zstandard") or _installed("compression.zstd") else []),
+    *(["br"] if _installed("brotli") or _installed("brotlicffi") else []),
+    "gzip",
+    "deflate",
+]
+ACCEPT_ENCODING = ", ".join(ENCODINGS)
+
+
+@cache
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        import brotlicffi as brotli
+    return brotli
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    try:
+        from compression import zstd
+
+        return zstd.decompress(data)
+    except ImportError:
+        import zstandard
+
+        # a streaming reader: frames need not declare their content size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def _deflate_decompress(data: bytes) -> bytes:
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        # some servers send raw deflate without the zlib header
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+
+
+DECODERS = {
+    "identity": lambda data: data,
+    "gzip": lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS),
+    "x-gzip": lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS),
+    "deflate": _deflate_decompress,
+    "br": lambda data: _brotli().decompress(data),
+    "zstd": _zstd_decompress,
+}
+
+
+class PageBody:
+    """A fetched page as received: the body bytes and their content coding.
+
+    Pages are kept (and cached) compressed; content() decompresses them
+    and str() also decodes the text, only when a page is actually read.
+    keep_content() holds on to the decompressed body for the checks made
+    right after a fetch, until release_content().
+    """
+
+    __slots__ = ("data", "encoding", "charset", "_content")
+
+    def __init__(
+        self, data: bytes, encoding: str | None = None, charset: str | None = None
+    ):
+        self.data = data
+        self.encoding = encoding.lower() if encoding else "identity"
+        self.charset = charset or "utf-8"
+        self._content: bytes | None = None
+
+    def __repr__(self) -> str:
+        return f"PageBody({len(self.data)} bytes, {self.encoding})"
+
+    def content(self) -> bytes:
+        """The decompressed body, undoing every coding in reverse order."""
+        if self._content is not None:
+            return self._content
+        data = self.data
+        for coding in reversed(self.encoding.split(",")):
+            coding = coding.strip()
+            if coding not in DECODERS:
+                raise ValueError(f"Unsupported content encoding: {coding}")
+            data = DECODERS[coding](data)
+        return data
+
+    def keep_content(self) -> bytes:
+        """content(), kept so later reads of the page skip decompressing."""
+        self._content = self.content()
+        return self._content
+
+    def release_content(self) -> None:
+        """Drop the body kept by keep_content(); only `data` stays in memory."""
+        self._content = None
+
+    def __getstate__(self) -> tuple:
+        # the kept body is never pickled into the page cache
+        slots = {"data": self.data, "encoding": self.encoding}
+        return None, {**slots, "charset": self.charset}
+
+    def __setstate__(self, state: tuple) -> None:
+        for name, value in state[1].items():
+            setattr(self, name, value)
+        self._content = None
+
+    def __str__(self) -> str:
+        return self.content().decode(self.charset, errors="replace")
+
+
+def page_content(
+    page: str | bytes | memoryview | PageBody,
+) -> str | bytes | memoryview:
+    """What the parsers read: a PageBody's decompressed UTF-8 bytes (text
+    for other charsets), else the page itself."""
+    if not isinstance(page, PageBody):
+        return page
+    if page.charset.replace("-", "").lower() == "utf8":
+        return page.content()
+    return str(page)
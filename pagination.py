@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from metrics import registry
+from page_body import PageBody, page_content
+
+DUPLICATE_LISTINGS = registry.counter(
+    "aqar_duplicate_listings_total",
+    "Listings skipped because an earlier page of the crawl already had them",
+)
+PAGINATION_GAPS = registry.counter(
+    "aqar_pagination_gaps_total", "Listings skipped over between two fetched pages"
+)
+PAGES_REFETCHED = registry.counter(
+    "aqar_pages_refetched_total", "Pages fetched again to fill pagination gaps"
+)
+
+# the Apollo `find(...)` result of a results page: offset, page size, the
+# total number of results when the page was served, and the listing refs
+_FIND_RESULT = re.compile(
+    rb'"find\(\{\\"from\\":(\d+),\\"size\\":(\d+),.*?\}\)"\s*:\s*\{'
+    rb'\s*"__typename"\s*:\s*"WebResults"\s*,'
+    rb'\s*"total"\s*:\s*(\d+)\s*,'
+    rb'\s*"listings"\s*:\s*\[(.*?)\]',
+    re.DOTALL,
+)
+_LISTING_REF = re.compile(rb"ElasticWebListing:(\d+)")
+
+
+@dataclass(frozen=True)
+class PageWindow:
+    """Where a fetched page sits in the result list when it was served."""
+
+    page_num: int
+    offset: int
+    size: int
+    total: int
+    ids: tuple[int, ...]
+
+
+def page_window(page_num: int, page: str | bytes | PageBody) -> PageWindow | None:
+    """The page's `find(...)` result, or None if the page has none."""
+    page = page_content(page)
+    match = _FIND_RESULT.search(page.encode() if isinstance(page, str) else page)
+    if match is None:
+        return None
+    offset, size, total, refs = match.groups()
+    ids = tuple(int(i) for i in _LISTING_REF.findall(refs))
+    return PageWindow(page_num, int(offset), int(size), int(total), ids)
+
+
+def drop_seen(items: list, ids: Iterable, seen: set[int] | None) -> list:
+    """Items whose listing id is not in `seen` yet; their ids are added.
+
+    With `seen` None, every item is kept. Items without an id are kept.
+    """
+    if seen is None:
+        return items
+    kept = []
+    for item, listing_id in zip(items, ids):
+        if listing_id is not None:
+            if listing_id in seen:
+                DUPLICATE_LISTINGS.inc()
+                continue
+            seen.add(listing_id)
+        kept.append(item)
+    return kept
+
+
+class DriftTracker:
+    """Tracks the listing ids of the pages of one crawl to detect drift.
+
+    Results are sorted newest first, so listings created during the crawl
+    push older ones onto later pages: a page fetched after the one before
+    it repeats that page's last listings, and a page fetched before it
+    starts past listings that then moved onto it and are never fetched.
+    The `total` of each page's results tells how far the list moved between
+    two fetches; pages that share a listing are known to be contiguous.
+    """
+
+    def __init__(self):
+        self.windows: dict[int, PageWindow] = {}
+        # total of the most recently fetched page, the list as it is now
+        self.latest_total: int | None = None
+        # listings fetched again on a later page
+        self.duplicates = 0
+        self._seen: set[int] = set()
+        self._lock = threading.Lock()
+
+    def observe(
+        self, page_num: int, page: str | bytes | PageBody | None
+    ) -> PageWindow | None:
+        """Record a fetched page; called as pages arrive, from any thread.
+
+        Pages without a `find(...)` result, or whose offset does not match
+        their page number, are not tracked.
+        """
+        window = page_window(page_num, page) if page else None
+        if window is None or window.offset != (page_num - 1) * window.size:
+            return None
+        with self._lock:
+            self.windows[page_num] = window
+            self.latest_total = window.total
+            self.duplicates += len(self._seen.intersection(window.ids))
+            self._seen.update(window.ids)
+        return window
+
+    def gaps(self) -> dict[int, int]:
+        """`page_num -> listings missed right before that page`."""
+        gaps = {}
+        for page_num, window in sorted(self.windows.items()):
+            previous = self.windows.get(page_num - 1)
+            if previous is None or set(previous.ids) & set(window.ids):
+                continue
+            # results added between the two fetches shifted this page by
+            # total - previous.total relative to the previous one
+            missed = previous.total - window.total
+            if missed > 0:
+                gaps[page_num] = missed
+        return gaps
+
+    def refetch_pages(self, page_num: int) -> range:
+        """Pages that now hold the listings missed right before `page_num`.
+
+        The missed listings followed the previous page when it was served
+        and have since moved down with the rest of the list, by the growth
+        of `latest_total`.
+        """
+        previous = self.windows[page_num - 1]
+        missed = self.gaps().get(page_num, 0)
+        start = previous.offset + previous.size
+        start = max(0, start + self.latest_total - previous.total)
+        end = start + missed
+        return range(start // previous.size + 1, (end - 1) // previous.size + 2)
+
+    def observe_refetch(self, page: str | bytes | PageBody | None) -> None:
+        """Update `latest_total` from a page fetched again, whose listings
+        the crawl has seen by now."""
+        window = page_window(0, page) if page else None
+        if window is not None:
+            with self._lock:
+                self.latest_total = window.total
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class StageProfiler:
+    """Wall-clock totals per named pipeline stage.
+
+    Disabled by default so that `stage()` costs a single attribute check in
+    normal runs. Stages running in worker threads add up their thread time,
+    so a stage total can exceed the run's wall time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.totals: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                calls_seconds = self.totals.setdefault(name, [0, 0.0])
+                calls_seconds[0] += 1
+                calls_seconds[1] += elapsed
+
+    def report(self) -> str:
+        lines = [f"{'stage':<40} {'calls':>8} {'seconds':>10} {'ms/call':>10}"]
+        for name, (calls, seconds) in sorted(
+            self.totals.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append(
+                f"{name:<40} {calls:>8} {seconds:>10.3f} {seconds / calls * 1000:>10.3f}"
+            )
+        return "\n".join(lines)
+
+
+profiler = StageProfiler()
+stage = profiler.stage
+
+
+@contextmanager
+def profile_run(output_dir: Path, name: str, enabled: bool = True) -> Iterator[None]:
+    """Profile the enclosed run and write the reports to `output_dir`.
+
+    Writes `<name>.pstats` (cProfile of the calling thread, for snakeviz or
+    pstats) and `<name>_profile.txt` with the stage totals followed by the
+    top functions by cumulative time.
+    """
+    if not enabled:
+        yield
+        return
+    import cProfile
+    import io
+    import pstats
+
+    profiler.enabled = True
+    profiler.totals.clear()
+    cprofile = cProfile.Profile()
+    cprofile.enable()
+    try:
+        yield
+    finally:
+        cprofile.disable()
+        profiler.enabled = False
+        output_dir.mkdir(parents=True, exist_ok=True)
+        cprofile.dump_stats(output_dir / f"{name}.pstats")
+        functions = io.StringIO()
+        pstats.Stats(cprofile, stream=functions).sort_stats("cumulative").print_stats(
+            30
+        )
+        report_path = output_dir / f"{name}_profile.txt"
+        report_path.write_text(
+            "Pipeline stages\n\n"
+            + profiler.report()
+            + "\n\nTop functions by cumulative time\n"
+            + functions.getvalue(),
+            encoding="utf-8",
+        )
+        print(f"Profile saved to {report_path}")
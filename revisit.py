@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import argparse
+import math
+import sqlite3
+import time
+from collections.abc import Mapping
+from pathlib import Path
+
+from pagination import PageWindow
+
+default_revisit_path = Path("./data/cache") / "revisit.sqlite"
+
+# Prior of the fresh-listing rate of a page: as if it had shown
+# PRIOR_FRESH fresh listings over PRIOR_SECONDS before its first revisit
+PRIOR_FRESH = 1.0
+PRIOR_SECONDS = 7 * 24 * 3600
+
+# SQLite caps the number of bound parameters per statement
+_BATCH_SIZE = 900
+
+
+class RevisitScheduler:
+    """Learns how fast each results page yields fresh listings.
+
+    A listing is fresh when its id is new or its `last_update` moved since
+    any earlier crawl saw it. After every crawl, each fetched page is
+    credited with the fresh listings it held, and its rate is estimated as
+    fresh listings per second between visits. Early pages collect new
+    listings; deep pages mostly hold listings that were shifted onto them
+    and are fresh only when updated, so their rate stays low.
+
+    schedule() spends a request budget on the pages expected to hold the
+    most fresh listings now: rate times the time since the last visit,
+    capped at the page size.
+    """
+
+    def __init__(self, path: Path = default_revisit_path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    id INTEGER PRIMARY KEY,
+                    last_update INTEGER
+                )
+                """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    page_num INTEGER PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    visits INTEGER NOT NULL,
+                    last_visit REAL NOT NULL,
+                    fresh REAL NOT NULL,
+                    seconds REAL NOT NULL
+                )
+                """)
+            # results total and page size of the latest crawl
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl (
+                    key TEXT PRIMARY KEY,
+                    value REAL NOT NULL
+                )
+                """)
+
+    def _known(self, ids: list[int]) -> dict[int, int | None]:
+        known = {}
+        for start in range(0, len(ids), _BATCH_SIZE):
+            batch = ids[start : start + _BATCH_SIZE]
+            rows = self.conn.execute(
+                f"SELECT id, last_update FROM listings "
+                f"WHERE id IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            known.update(rows)
+        return known
+
+    def record(
+        self,
+        windows: Mapping[int, PageWindow],
+        last_updates: Mapping[int, int | None],
+        visited_at: float | None = None,
+    ) -> int:
+        """Credit the fetched pages with their fresh listings; returns how
+        many listings were fresh.
+
+        `windows` are the pages of a crawl (see DriftTracker.windows),
+        `last_updates` the `last_update` of their listings by id; listings
+        missing from it are taken as unchanged.
+        """
+        visited_at = time.time() if visited_at is None else visited_at
+        ids = sorted({i for window in windows.values() for i in window.ids})
+        known = self._known(ids)
+        stats = {
+            page_num: (visits, last_visit, fresh, seconds)
+            for page_num, visits, last_visit, fresh, seconds in self.conn.execute(
+                "SELECT page_num, visits, last_visit, fresh, seconds FROM pages"
+            )
+        }
+
+        fresh_total = 0
+        pages, listings = [], {}
+        for page_num, window in windows.items():
+            fresh = 0
+            for listing_id in window.ids:
+                if listing_id in listings:
+                    continue
+                last_update = last_updates.get(listing_id)
+                if listing_id not in known:
+                    fresh += 1
+                elif last_update is not None and last_update != known[listing_id]:
+                    fresh += 1
+                else:
+                    last_update = known[listing_id]
+                listings[listing_id] = last_update
+            fresh_total += fresh
+            if page_num in stats:
+                visits, last_visit, page_fresh, seconds = stats[page_num]
+                page_fresh += fresh
+                seconds += max(0.0, visited_at - last_visit)
+            else:
+                # a first visit has nothing to compare with
+                visits, page_fresh, seconds = 0, 0.0, 0.0
+            pages.append(
+                (page_num, window.size, visits + 1, visited_at, page_fresh, seconds)
+            )
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?)", listings.items()
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", pages
+            )
+            if windows:
+                latest = max(windows.values(), key=lambda w: w.page_num)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO crawl VALUES (?, ?)",
+                    [("total", latest.total), ("size", latest.size)],
+                )
+        return fresh_total
+
+    def expected_fresh(self, now: float | None = None) -> dict[int, float]:
+        """Fresh listings each known page is expected to hold now."""
+        now = time.time() if now is None else now
+        expected = {}
+        for page_num, size, last_visit, fresh, seconds in self.conn.execute(
+            "SELECT page_num, size, last_visit, fresh, seconds FROM pages"
+        ):
+            rate = (fresh + PRIOR_FRESH) / (seconds + PRIOR_SECONDS)
+            expected[page_num] = min(size, rate * max(0.0, now - last_visit))
+        return expected
+
+    def schedule(self, budget: int, now: float | None = None) -> list[int]:
+        """The `budget` pages expected to hold the most fresh listings now,
+        in page order.
+
+        Pages of the result list never visited (it grew, or the last crawl
+        stopped early) are estimated with the prior rate since the oldest
+        visit. Without any recorded crawl, these are the first `budget`
+        pages.
+        """
+        now = time.time() if now is None else now
+        expected = self.expected_fresh(now)
+        crawl = dict(self.conn.execute("SELECT key, value FROM crawl"))
+        if not crawl:
+            # newest listings first
+            return list(range(1, budget + 1))
+        page_count = math.ceil(crawl["total"] / crawl["size"])
+        oldest = self.conn.execute("SELECT MIN(last_visit) FROM pages").fetchone()[0]
+        unvisited = PRIOR_FRESH / PRIOR_SECONDS * max(0.0, now - oldest)
+        ranked = sorted(
+            range(1, page_count + 1),
+            key=lambda p: (-expected.get(p, min(crawl["size"], unvisited)), p),
+        )
+        return sorted(ranked[:budget])
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the page revisit schedule")
+    parser.add_argument("budget", type=int, help="requests to spend")
+    parser.add_argument("--revisit-log", type=Path, default=default_revisit_path)
+    args = parser.parse_args()
+
+    scheduler = RevisitScheduler(args.revisit_log)
+    expected = scheduler.expected_fresh()
+    pages = scheduler.schedule(args.budget)
+    fresh = sum(expected.get(p, 0) for p in pages)
+    print(f"{len(pages)} pages, ~{fresh:.0f} fresh listings expected from known pages")
+    print(" ".join(map(str, pages)))
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal
+
+from lazy import lazy_import
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
+# Column schema of the flat listing table written by main.py and read by
+# clean_data.py. The order here is the column order of the raw CSV.
+PRICE_COLUMNS = [
+    "price",
+    "meter_price",
+    "price_2_payments",
+    "price_4_payments",
+    "price_12_payments",
+    "rnpl_monthly_price",
+]
+
+NUMERIC_COLUMNS = [
+    "area_sqm",
+    "deed_area",
+    "num_bedrooms",
+    "num_bathrooms",
+    "num_living_rooms",
+    "num_kitchens",
+    "num_rooms",
+    "floor_level",
+]
+
+FLAG_COLUMNS = [
+    "furnished",
+    "duplex",
+    "ac",
+    "lift",
+    "maid_room",
+    "driver_room",
+    "pool",
+    "basement",
+    "backyard",
+    "playground",
+    "car_entrance",
+    "stairs",
+    "water_availability",
+    "electrical_availability",
+    "drainage_availability",
+    "private_roof",
+    "two_entrances",
+    "special_entrance",
+    "apartment_in_villa",
+]
+
+CATEGORY_COLUMNS = [
+    "category_id",
+    "category_ga_listing_type",
+    "category_ga_property_category",
+    "category_is_rent",
+    "category_name",
+    "category_en",
+    "category_plural",
+    "category_uri",
+    "category_path",
+    "category_keywords",
+    "category_description",
+    "category_index",
+]
+
+LISTING_SCHEMA: dict[str, str] = {
+    "id": "Int64",
+    "title": "string",
+    "url": "string",
+    **{col: "float64" for col in PRICE_COLUMNS},
+    **{col: "float64" for col in NUMERIC_COLUMNS},
+    **{col: "boolean" for col in FLAG_COLUMNS},
+    "street_width": "float64",
+    # only read by the HTML fallback parser, from the rendered cards
+    "zoning": "string",
+    "direction": "category",
+    "city": "category",
+    "district": "category",
+    "address": "string",
+    "latitude": "float64",
+    "longitude": "float64",
+    "category_id": "Int64",
+    "category_ga_listing_type": "category",
+    "category_ga_property_category": "category",
+    "category_is_rent": "boolean",
+    "category_name": "category",
+    "category_en": "category",
+    "category_plural": "category",
+    "category_uri": "category",
+    "category_path": "category",
+    "category_keywords": "category",
+    "category_description": "category",
+    "category_index": "Int64",
+    "sale_type": "category",
+    "is_rental": "boolean",
+    "is_sale": "boolean",
+    "is_auction": "boolean",
+    "is_daily_rental": "boolean",
+    "create_time": "Int64",
+    "published_at": "Int64",
+    "last_update": "Int64",
+    "verified": "Int8",
+    "boosted": "Int8",
+    "premium": "Int8",
+    "has_img": "Int8",
+    "has_video": "Int8",
+    # license and deed numbers are identifiers, not quantities: reading them
+    # as floats silently drops digits past 2**53
+    "ad_license_number": "string",
+    "deed_number": "string",
+    "rega_licensed": "boolean",
+    "plan_no": "string",
+    "parcel_no": "string",
+    "user_verified": "boolean",
+    "company_name": "string",
+    "user_paid_tier": "float64",
+    "description": "string",
+    "images": "string",
+    "videos": "string",
+}
+
+LISTING_COLUMNS = list(LISTING_SCHEMA)
+
+CsvEngine = Literal["c", "pyarrow", "python"]
+
+
+def conform_listings(df: pd.DataFrame) -> pd.DataFrame:
+    """Project a listings frame onto the schema: column order and dtypes.
+
+    Columns the schema does not know about are dropped (and reported),
+    schema columns the frame lacks are added as all-null. Text in numeric
+    columns that is not a number becomes null (and is reported).
+    """
+    extra = [col for col in df.columns if col not in LISTING_SCHEMA]
+    if extra:
+        print(f"Dropping columns not in listing schema: {extra}")
+    df = df.reindex(columns=LISTING_COLUMNS)
+    for col, dtype in LISTING_SCHEMA.items():
+        if dtype in ("string", "category"):
+            # list/dict cells are stored by their repr, as to_csv would
+            df[col] = df[col].map(
+                lambda v: str(v) if isinstance(v, (list, dict)) else v
+            )
+        elif dtype != "boolean" and not pd.api.types.is_numeric_dtype(df[col]):
+            values = pd.to_numeric(df[col], errors="coerce")
+            dropped = int((values.isna() & df[col].notna()).sum())
+            if dropped:
+                print(f"Dropping {dropped} non-numeric values of {col}")
+            df[col] = values
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def validate_listings(df: pd.DataFrame) -> None:
+    """Check that a frame matches the listing schema exactly.
+
+    Raises ValueError describing every mismatch. Used as the contract
+    between the scraper output and the cleaner input.
+    """
+    problems = []
+    missing = [col for col in LISTING_COLUMNS if col not in df.columns]
+    if missing:
+        problems.append(f"missing columns: {missing}")
+    extra = [col for col in df.columns if col not in LISTING_SCHEMA]
+    if extra:
+        problems.append(f"unexpected columns: {extra}")
+    for col, dtype in LISTING_SCHEMA.items():
+        if col in df.columns and str(df[col].dtype) != dtype:
+            problems.append(f"{col}: expected {dtype}, got {df[col].dtype}")
+    if problems:
+        raise ValueError("Listing schema mismatch: " + "; ".join(problems))
+
+
+def default_engine() -> CsvEngine:
+    """The multithreaded Arrow CSV reader when pyarrow is installed."""
+    return "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+
+def read_listings_csv(
+    path: Path,
+    columns: list[str] | None = None,
+    engine: CsvEngine | None = None,
+) -> pd.DataFrame:
+    """Read a raw listings CSV with explicit dtypes.
+
+    `columns` projects the read onto a subset of the schema (unknown names
+    raise); schema columns the file predates are read as all-null.
+    `engine="pyarrow"` uses the multithreaded Arrow CSV reader, the default
+    when pyarrow is installed; both engines return the same frame.
+    """
+    engine = engine or default_engine()
+    if columns is None:
+        columns = LISTING_COLUMNS
+    unknown = [col for col in columns if col not in LISTING_SCHEMA]
+    if unknown:
+        raise ValueError(f"Columns not in listing schema: {unknown}")
+    header = set(pd.read_csv(path, nrows=0).columns)
+    dtypes = {col: LISTING_SCHEMA[col] for col in columns if col in header}
+    if engine == "pyarrow":
+        df = _read_csv_arrow(path, dtypes)
+    else:
+        df = pd.read_csv(path, usecols=list(dtypes), dtype=dtypes, engine=engine)
+    for col in columns:
+        if col not in header:
+            df[col] = pd.Series(pd.NA, index=df.index).astype(LISTING_SCHEMA[col])
+    return df[columns]
+
+
+def _read_csv_arrow(path: Path, dtypes: dict[str, str]) -> pd.DataFrame:
+    # pandas' pyarrow engine cannot be told that quoted values may contain
+    # newlines (descriptions do), so drive pyarrow.csv directly
+    import pyarrow as pa
+    from pyarrow import csv
+
+    arrow_types = {
+        "string": pa.string(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "float64": pa.float64(),
+        "Int64": pa.int64(),
+        "Int8": pa.int8(),
+        "boolean": pa.bool_(),
+    }
+    table = csv.read_csv(
+        path,
+        parse_options=csv.ParseOptions(newlines_in_values=True),
+        convert_options=csv.ConvertOptions(
+            include_columns=list(dtypes),
+            # empty cells are missing values, as with the pandas engines
+            strings_can_be_null=True,
+            column_types={col: arrow_types[dtype] for col, dtype in dtypes.items()},
+        ),
+    )
+    df = table.to_pandas().astype(dtypes)
+    # categories in sorted order, as the pandas engines infer them
+    for col, dtype in dtypes.items():
+        if dtype == "category":
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return df
+
+
+def engine_differences(path: Path) -> list[str]:
+    """Columns the c and pyarrow engines read differently from `path`."""
+    c = read_listings_csv(path, engine="c")
+    arrow = read_listings_csv(path, engine="pyarrow")
+    differences = []
+    for col in LISTING_COLUMNS:
+        try:
+            pd.testing.assert_series_equal(c[col], arrow[col])
+        except AssertionError as e:
+            differences.append(f"{col}: {str(e).strip().splitlines()[0]}")
+    return differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that both CSV engines read a raw listings CSV alike"
+    )
+    parser.add_argument(
+        "path", type=Path, nargs="?", default=Path("./data/raw/aqar_fm_listings.csv")
+    )
+    args = parser.parse_args()
+
+    for engine in ("c", "pyarrow"):
+        start = time.perf_counter()
+        df = read_listings_csv(args.path, engine=engine)
+        print(f"{engine:<8} {time.perf_counter() - start:8.3f}s {len(df)} rows")
+    differences = engine_differences(args.path)
+    if differences:
+        print("Engines disagree:")
+        for line in differences:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("Engines agree")
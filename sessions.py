@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+from metrics import registry
+from page_body import PageBody
+
+if TYPE_CHECKING:
+    import httpx
+else:
+    httpx = lazy_import("httpx")
+
+# cookie name -> environment variable; further credential sets use the same
+# variables suffixed with _2, _3, ...
+COOKIE_ENV = {
+    "req-device-token": "REQ_DEVICE_TOKEN",
+    "cf_clearance": "CF_CLEARANCE",
+    "__cf_bm": "CF_BM",
+}
+PLACEHOLDER = "get-your-cookies"
+
+# requests per second each session may make (None: no limit, unless the
+# SESSION_RATE environment variable sets one), and how many it may make at
+# once after being idle
+SESSION_RATE = None
+SESSION_BURST = 10
+# how long a blocked session is left out before it is tried again
+QUARANTINE_SECONDS = 900
+
+BLOCK_MARKER = b"you have been blocked"
+
+SESSIONS_HEALTHY = registry.gauge("aqar_sessions_healthy", "Sessions not quarantined")
+SESSIONS_QUARANTINED = registry.counter(
+    "aqar_sessions_quarantined_total", "Sessions quarantined after a block page"
+)
+SESSION_WAIT_SECONDS = registry.counter(
+    "aqar_session_wait_seconds_total", "Time spent waiting for a session's budget"
+)
+
+
+class SessionsBlocked(AssertionError):
+    """Every session is quarantined; the crawl stops as on a block page."""
+
+
+def load_credentials(environ: Mapping[str, str] = os.environ) -> list[dict[str, str]]:
+    """Cookie sets from the environment, one per credential set.
+
+    The first set is REQ_DEVICE_TOKEN/CF_CLEARANCE/CF_BM, the next ones the
+    same variables suffixed with _2, _3, ... up to the first missing
+    REQ_DEVICE_TOKEN_<n>. Without any, one set of placeholders is returned.
+    """
+    credentials = []
+    suffix = ""
+    while f"REQ_DEVICE_TOKEN{suffix}" in environ:
+        credentials.append(
+            {
+                cookie: environ.get(f"{variable}{suffix}", PLACEHOLDER)
+                for cookie, variable in COOKIE_ENV.items()
+            }
+        )
+        suffix = f"_{len(credentials) + 1}"
+    return credentials or [{cookie: PLACEHOLDER for cookie in COOKIE_ENV}]
+
+
+def load_session_rate(environ: Mapping[str, str] = os.environ) -> float | None:
+    """Per-session request rate from SESSION_RATE, or the default without it."""
+    value = environ.get("SESSION_RATE", "").strip()
+    if not value:
+        return SESSION_RATE
+    rate = float(value)
+    if rate <= 0:
+        raise ValueError(f"SESSION_RATE must be positive, got {value}")
+    return rate
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst`; a None rate never waits."""
+
+    def __init__(self, rate: float | None, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.rate is not None:
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        if self.rate is None or self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> float:
+        """Reserve a token; returns the seconds to wait before using it."""
+        wait = self.wait_time(now)
+        if self.rate is not None:
+            self.tokens -= 1
+        return wait
+
+
+class Session:
+    """One credential set: its client, request budget and health."""
+
+    def __init__(
+        self,
+        name: str,
+        cookies: dict[str, str],
+        headers: dict[str, str],
+        rate: float | None,
+        burst: int,
+    ):
+        self.name = name
+        self.client = httpx.Client(
+            cookies=cookies, headers=headers, follow_redirects=True
+        )
+        self.bucket = TokenBucket(rate, burst)
+        self.quarantined_until = 0.0
+        self.requests = 0
+        self.blocks = 0
+
+    def healthy(self, now: float) -> bool:
+        return self.quarantined_until <= now
+
+
+class SessionPool:
+    """Spreads requests over several browser sessions.
+
+    Each credential set gets its own `httpx.Client` (cookies, connection
+    pool) and a token bucket of `rate` requests per second. A request goes
+    to the healthy session whose budget frees up first, so throughput grows
+    with the number of sessions. A session that gets the block page is
+    quarantined for `quarantine_seconds` and the request is retried on
+    another one; once all are quarantined, SessionsBlocked is raised.
+    """
+
+    def __init__(
+        self,
+        credentials: list[dict[str, str]],
+        headers: dict[str, str] | None = None,
+        rate: float | None = SESSION_RATE,
+        burst: int = SESSION_BURST,
+        quarantine_seconds: float = QUARANTINE_SECONDS,
+    ):
+        if not credentials:
+            raise ValueError("A session pool needs at least one credential set")
+        self.sessions = [
+            Session(f"session-{i + 1}", cookies, headers or {}, rate, burst)
+            for i, cookies in enumerate(credentials)
+        ]
+        self.quarantine_seconds = quarantine_seconds
+        self._lock = threading.Lock()
+        SESSIONS_HEALTHY.set(len(self.sessions))
+
+    def acquire(self) -> Session:
+        """A healthy session with budget left, waiting for one if needed."""
+        with self._lock:
+            now = time.monotonic()
+            healthy = [s for s in self.sessions if s.healthy(now)]
+            SESSIONS_HEALTHY.set(len(healthy))
+            if not healthy:
+                raise SessionsBlocked("Blocked by the website on every session")
+            session = min(healthy, key=lambda s: (s.bucket.wait_time(now), s.requests))
+            wait = session.bucket.take(now)
+            session.requests += 1
+        if wait:
+            SESSION_WAIT_SECONDS.inc(wait)
+            time.sleep(wait)
+        return session
+
+    def quarantine(self, session: Session) -> None:
+        with self._lock:
+            session.blocks += 1
+            session.quarantined_until = time.monotonic() + self.quarantine_seconds
+        SESSIONS_QUARANTINED.inc()
+        print(f"{session.name} got the block page, quarantined")
+
+    def get(self, url: str, timeout: float) -> PageBody:
+        """GET `url` through the pool, skipping sessions that get blocked.
+
+        The body is returned as received, still compressed, with its
+        decompressed content kept (see PageBody.keep_content()) for the
+        caller's checks. Server errors (5xx) raise httpx.HTTPStatusError.
+        """
+        while True:
+            session = self.acquire()
+            with session.client.stream("GET", url, timeout=timeout) as response:
+                body = PageBody(
+                    b"".join(response.iter_raw()),
+                    response.headers.get("content-encoding"),
+                    response.charset_encoding,
+                )
+                if response.is_server_error:
+                    response.raise_for_status()
+            if BLOCK_MARKER not in body.keep_content().lower():
+                return body
+            self.quarantine(session)
+
+    def close(self) -> None:
+        for session in self.sessions:
+            session.client.close()
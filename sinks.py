@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SinkFormat = Literal["csv", "json", "jsonl"]
+
+SINK_SUFFIXES: dict[str, str] = {"csv": ".csv", "json": ".json", "jsonl": ".jsonl"}
+
+
+@dataclass(frozen=True)
+class Sink:
+    """One output file: where it goes, how it is encoded, which rows it gets.
+
+    `sale_type=None` routes every row to the sink.
+    """
+
+    path: Path
+    format: SinkFormat = "csv"
+    sale_type: str | None = None
+
+
+def write_frame(df: pd.DataFrame, path: Path, format: SinkFormat) -> Path:
+    if format == "csv":
+        df.to_csv(path, index=False, lineterminator="\n")
+    elif format == "json":
+        df.to_json(path, orient="records", force_ascii=False, indent=2)
+    elif format == "jsonl":
+        df.to_json(path, orient="records", force_ascii=False, lines=True)
+    else:
+        raise ValueError(f"Unknown sink format: {format}")
+    return path
+
+
+def write_sinks(
+    df: pd.DataFrame, sinks: list[Sink], max_workers: int | None = None
+) -> list[Path]:
+    """Route rows of `df` to every sink and write the files concurrently.
+
+    Rows are partitioned by `sale_type` in a single pass; each partition is
+    materialized once and shared by all sinks that want it.
+    """
+    positions = (
+        df.groupby("sale_type", observed=True, sort=False).indices
+        if "sale_type" in df.columns
+        else {}
+    )
+    parts: dict[str | None, pd.DataFrame] = {None: df}
+    for sink in sinks:
+        if sink.sale_type not in parts:
+            rows = positions.get(sink.sale_type, [])
+            parts[sink.sale_type] = df.take(rows)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(sinks) or 1) as executor:
+        futures = [
+            executor.submit(write_frame, parts[sink.sale_type], sink.path, sink.format)
+            for sink in sinks
+        ]
+        return [future.result() for future in futures]
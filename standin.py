@@ -0,0 +1,166 @@
+import gzip
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+NO_RESULTS_PAGE = "<html><body><p>لا توجد نتائج</p></body></html>".encode()
+BLOCK_PAGE = b"<html><body><h1>Sorry, you have been blocked</h1></body></html>"
+ERROR_PAGE = b"<html><body><h1>503 Service Unavailable</h1></body></html>"
+STATIC_PAGES = (NO_RESULTS_PAGE, BLOCK_PAGE, ERROR_PAGE)
+
+
+def _encoders() -> dict:
+    """Content codings the stand-in can serve, best first."""
+    encoders = {}
+    try:
+        import zstandard
+
+        # compressor objects are not thread-safe, one per body
+        encoders["zstd"] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+    except ImportError:
+        pass
+    try:
+        import brotli
+
+        encoders["br"] = lambda body: brotli.compress(body, quality=5)
+    except ImportError:
+        pass
+    encoders["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+    return encoders
+
+
+class StandInServer:
+    """Local HTTP stand-in for the listing site that replays saved pages.
+
+    `/<anything>/<n>` serves `pages[n - 1]`; page numbers past the end get
+    the "no results" page the scraper stops on. Requests carrying a cookie
+    value in `blocked` get the block page instead. With `compress`, bodies
+    are sent in the best coding the request accepts. Runs in a background
+    thread for the lifetime of the `with` block.
+
+    `pages` may be any sequence, e.g. pages generated on request (see
+    synthetic.py). For load tests, every response can be delayed by
+    `latency` seconds (plus up to `jitter` more), and a random `error_rate`
+    share of requests gets a 503 and a `block_rate` share the block page.
+    """
+
+    def __init__(
+        self,
+        pages: list[bytes],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        blocked: set[str] | None = None,
+        compress: bool = False,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        block_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.pages = pages
+        self.blocked = blocked or set()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self._random = random.Random(seed)
+        self.encoders = _encoders() if compress else {}
+        # (id of the body, coding) -> compressed body
+        self._encoded: dict[tuple[int, str], bytes] = {}
+        self.requests = 0
+        self.errors = 0
+        self.blocks = 0
+        # requests per req-device-token cookie
+        self.requests_by_device: Counter[str] = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def page_url(self, page_num: int) -> str:
+        return f"{self.url}listings/{page_num}"
+
+    def respond(self, path: str, cookies: dict[str, str]) -> tuple[int, bytes]:
+        """Status and body for a request path."""
+        with self._lock:
+            draw = self._random.random()
+            delay = self.latency + self._random.random() * self.jitter
+        if delay:
+            time.sleep(delay)
+        if draw < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return 503, ERROR_PAGE
+        if draw < self.error_rate + self.block_rate or self.blocked.intersection(
+            cookies.values()
+        ):
+            with self._lock:
+                self.blocks += 1
+            return 403, BLOCK_PAGE
+        try:
+            page_num = int(urlsplit(path).path.rstrip("/").split("/")[-1])
+        except ValueError:
+            return 404, b"not found"
+        if 1 <= page_num <= len(self.pages):
+            return 200, self.pages[page_num - 1]
+        return 200, NO_RESULTS_PAGE
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                cookies = {}
+                for part in self.headers.get("cookie", "").split(";"):
+                    name, _, value = part.strip().partition("=")
+                    if name:
+                        cookies[name] = value
+                status, body = standin.respond(self.path, cookies)
+                accepted = {
+                    coding.split(";")[0].strip()
+                    for coding in self.headers.get("accept-encoding", "").split(",")
+                }
+                coding = next((c for c in standin.encoders if c in accepted), None)
+                if coding and (isinstance(standin.pages, list) or body in STATIC_PAGES):
+                    # these bodies live as long as the server: encode them once
+                    key = (id(body), coding)
+                    if key not in standin._encoded:
+                        standin._encoded[key] = standin.encoders[coding](body)
+                    body = standin._encoded[key]
+                elif coding:
+                    body = standin.encoders[coding](body)
+                self.send_response(status)
+                self.send_header("content-type", "text/html; charset=utf-8")
+                if coding:
+                    self.send_header("content-encoding", coding)
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with standin._lock:
+                    standin.requests += 1
+                    standin.requests_by_device[cookies.get("req-device-token")] += 1
+                    standin.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import re
+import time
+from collections.abc import Sequence
+from functools import partial
+from pathlib import Path
+
+from main import CATEGORIES_JSON, extract_next_data, get_category_details
+
+external_dir = Path("./data/external")
+bench_dir = Path("./data/bench")
+default_template_path = external_dir / "category1.html"
+
+# ids of the synthetic listings start above the real ones
+FIRST_ID = 90_000_000
+# create_time of the newest listing, and the mean time between listings
+NEWEST_TIME = 1_766_000_000
+LISTING_INTERVAL = 60
+
+_FIND_KEY = re.compile(r"^find\(")
+_WORD = re.compile(r"\w+")
+# placeholders in the serialized template, replaced on every page
+_FIND_MARK = "__synthetic_find__"
+_LISTINGS_MARK = "__synthetic_listings__"
+
+
+class SyntheticPages(Sequence[bytes]):
+    """`pages` result pages holding `listings` synthetic listings.
+
+    Built from a saved results page: its markup, and the `__NEXT_DATA__`
+    state with the template's listings replaced by generated ones. Every
+    listing is derived from one of the template listings with its own id,
+    times, price, size, category (from get_category_details), Arabic title
+    and text, and coordinates near the template's. Listings are sorted
+    newest first like the site, and `pages[i]` is the UTF-8 body of page
+    i + 1. Pages are generated on request from a seeded generator, so
+    they are the same on every call and need no memory to keep.
+
+    Only the `__NEXT_DATA__` state is generated: the rendered listing
+    cards in the markup stay the template's.
+    """
+
+    def __init__(
+        self,
+        pages: int,
+        listings: int,
+        template: Path = default_template_path,
+        seed: int = 0,
+    ):
+        if pages < 1 or listings < 0:
+            raise ValueError("Need at least one page and no negative listings")
+        self.pages = pages
+        self.listings = listings
+        self.size = max(1, math.ceil(listings / pages))
+        self.seed = seed
+
+        html = template.read_text(encoding="utf-8")
+        next_data = extract_next_data(html)
+        if next_data is None:
+            raise ValueError(f"{template} has no __NEXT_DATA__ script")
+        head, tail = html.split(next_data, 1)
+        data = json.loads(next_data)
+        state = data["props"]["pageProps"]["__APOLLO_STATE__"]
+        self.templates = [
+            value
+            for key, value in state.items()
+            if key.startswith("ElasticWebListing:")
+        ]
+        if not self.templates:
+            raise ValueError(f"{template} has no listings to derive from")
+        web = state["ROOT_QUERY"]["Web"]
+        find_key = next(key for key in web if _FIND_KEY.match(key))
+        self._find_query = json.loads(find_key[len("find(") : -1])
+
+        # the state without the template's listings, with placeholders where
+        # the find result and the generated listings go
+        new_state = {
+            key: value
+            for key, value in state.items()
+            if not key.startswith("ElasticWebListing:")
+        }
+        new_web = {}
+        for key, value in web.items():
+            if key == find_key:
+                new_web[_FIND_MARK] = 0
+            else:
+                new_web[key] = value
+        new_state["ROOT_QUERY"] = {**state["ROOT_QUERY"], "Web": new_web}
+        new_state[_LISTINGS_MARK] = 0
+        data["props"]["pageProps"]["__APOLLO_STATE__"] = new_state
+        serialized = json.dumps(data, ensure_ascii=False)
+        before_find, rest = serialized.split(f'"{_FIND_MARK}": 0', 1)
+        between, after = rest.split(f', "{_LISTINGS_MARK}": 0', 1)
+        self._parts = [head + before_find, between, after + tail]
+
+        texts = [
+            f"{listing.get('title') or ''} {listing.get('content') or ''}"
+            for listing in self.templates
+        ]
+        self.words = sorted({word for text in texts for word in _WORD.findall(text)})
+        self.categories = [
+            get_category_details(key) for key in json.loads(CATEGORIES_JSON)
+        ]
+        # the "all categories" entry is no listing category
+        self.categories = [c for c in self.categories if c and c["id"] != 0]
+
+    def __len__(self) -> int:
+        return self.pages
+
+    def __getitem__(self, i: int) -> bytes:
+        if i < 0:
+            i += self.pages
+        if not 0 <= i < self.pages:
+            raise IndexError(f"page {i} out of range")
+        return self.page(i + 1).encode("utf-8")
+
+    def listing(self, n: int) -> dict:
+        """Listing number `n` of the result list, 0 being the newest."""
+        rng = random.Random(self.seed * 1_000_003 + n)
+        listing = dict(rng.choice(self.templates))
+        listing_id = FIRST_ID + self.listings - n
+        category = rng.choice(self.categories)
+        created = NEWEST_TIME - n * LISTING_INTERVAL - rng.randrange(LISTING_INTERVAL)
+        updated = created + rng.choice([0, 0, rng.randrange(30 * 24 * 3600)])
+
+        if category.get("is_rent"):
+            price = round(rng.lognormvariate(10.8, 0.7), -2)
+        else:
+            price = round(rng.lognormvariate(13.8, 0.8), -3)
+        area = rng.randrange(60, 1500)
+        rooms = rng.randrange(1, 8)
+        district = listing.get("district") or ""
+        city = listing.get("city") or ""
+        street = " ".join(rng.choices(self.words, k=rng.randrange(2, 5)))
+        address = f"{street}, {district}, مدينة {city}"
+        location = listing.get("location") or {}
+
+        listing.update(
+            id=listing_id,
+            category=category["id"],
+            create_time=created,
+            published_at=created,
+            last_update=updated,
+            refresh=updated,
+            price=price,
+            rega_total_price=price,
+            meter_price=round(price / area) if category.get("id") == 2 else None,
+            area=area,
+            deed_area=area + round(rng.random() * 5, 1),
+            beds=rooms,
+            rooms=rooms,
+            livings=rng.randrange(0, 4),
+            wc=rng.randrange(1, 6),
+            age=rng.randrange(0, 30),
+            user_id=rng.randrange(1, 5_000_000),
+            location={
+                **location,
+                "lat": round(location.get("lat", 24.7) + rng.uniform(-0.05, 0.05), 6),
+                "lng": round(location.get("lng", 46.7) + rng.uniform(-0.05, 0.05), 6),
+            },
+            content=" ".join(rng.choices(self.words, k=rng.randrange(10, 80))),
+            address=address,
+            title=f"{category['name']} في {address}",
+            uri=f"{street.replace(' ', '-')}-{listing_id}",
+            path=(
+                f"{category['path']}/{city}/{district}/"
+                f"{street.replace(' ', '-')}-{listing_id}"
+            ),
+        )
+        return listing
+
+    def page(self, page_num: int) -> str:
+        """HTML of results page `page_num`; empty past the last listing."""
+        offset = (page_num - 1) * self.size
+        numbers = range(offset, min(offset + self.size, self.listings))
+        listings = [self.listing(n) for n in numbers]
+        query = {**self._find_query, "from": offset, "size": self.size}
+        find_key = "find(" + json.dumps(query, separators=(",", ":")) + ")"
+        result = {
+            "__typename": "WebResults",
+            "total": self.listings,
+            "listings": [
+                {"__ref": f"ElasticWebListing:{listing['id']}"} for listing in listings
+            ],
+        }
+        entries = "".join(
+            ", "
+            + json.dumps(f"ElasticWebListing:{listing['id']}")
+            + ": "
+            + json.dumps(listing, ensure_ascii=False)
+            for listing in listings
+        )
+        return (
+            self._parts[0]
+            + json.dumps(find_key)
+            + ": "
+            + json.dumps(result)
+            + self._parts[1]
+            + entries
+            + self._parts[2]
+        )
+
+
+def measure(pages: SyntheticPages, workers: int, **server_options) -> dict:
+    """Seconds the fetch, parse and clean stages take over `pages`.
+
+    The pages are fetched uncached from a stand-in server by `workers`
+    threads through as many unthrottled sessions, parsed uncached into the
+    raw frame, and cleaned. `rows` are the listings parsed, and
+    `missing_rows` those of `listings` that were not.
+    """
+    import clean_data
+    import main
+    from schema import conform_listings
+    from sessions import SessionPool
+    from standin import StandInServer
+
+    main.init()
+    # the stand-in blocks single requests at random rather than sessions, so
+    # a blocked page is requested again at once on another session
+    main.session_pool = SessionPool(
+        [{"req-device-token": f"synthetic-{i + 1}"} for i in range(workers)],
+        main.REQUEST_HEADERS,
+        rate=None,
+        quarantine_seconds=0,
+    )
+    main.MAX_WORKERS = workers
+    main.STOP_PAGE = float("inf")
+    timings = {"pages": len(pages), "listings": pages.listings}
+
+    with StandInServer(pages, compress=True, **server_options) as server:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetched = main.get_all_category_pages(
+                server.url + "listings/",
+                fetch=partial(main.fetch_data, use_cache=False),
+                page_nums=range(1, len(pages) + 2),
+            )
+        timings["fetch_s"] = time.perf_counter() - start
+        timings["bytes_sent"] = server.bytes_sent
+        timings["errors"] = server.errors
+        timings["blocks"] = server.blocks
+
+    start = time.perf_counter()
+    df = main.build_listings_frame(
+        main.parse_all_category_pages(fetched, use_cache=False)
+    )
+    timings["parse_s"] = time.perf_counter() - start
+    del fetched
+    timings["rows"] = len(df)
+    timings["missing_rows"] = pages.listings - len(df)
+
+    df = conform_listings(df)
+    start = time.perf_counter()
+    clean_data.clean_dataframe(df)
+    timings["clean_s"] = time.perf_counter() - start
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic result pages for load and scaling tests"
+    )
+    parser.add_argument(
+        "mode",
+        choices=["corpus", "serve", "scale"],
+        help="corpus: write the pages to a page corpus; serve: serve them from "
+        "a stand-in server; scale: time fetch, parse and clean at every size",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        nargs="+",
+        default=[100],
+        help="page counts (several for scale)",
+    )
+    parser.add_argument(
+        "--per-page", type=int, default=20, help="listings per page (default: 20)"
+    )
+    parser.add_argument("--template", type=Path, default=default_template_path)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="corpus file or scale results (default: in data/bench)",
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=10, help="fetch threads")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="up to this many more seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of 503 responses"
+    )
+    parser.add_argument(
+        "--block-rate", type=float, default=0.0, help="share of block pages"
+    )
+    args = parser.parse_args()
+    server_options = dict(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        block_rate=args.block_rate,
+        seed=args.seed,
+    )
+
+    def synthetic(page_count: int) -> SyntheticPages:
+        return SyntheticPages(
+            page_count, page_count * args.per_page, args.template, args.seed
+        )
+
+    if args.mode == "corpus":
+        from corpus import write_corpus
+
+        pages = synthetic(args.pages[0])
+        path = args.output or bench_dir / "synthetic.corpus"
+        print(f"Writing {len(pages)} pages, {pages.listings} listings...")
+        print(f"Pages saved to {write_corpus(pages, path)}")
+    elif args.mode == "serve":
+        from standin import StandInServer
+
+        pages = synthetic(args.pages[0])
+        with StandInServer(
+            pages, port=args.port, compress=True, **server_options
+        ) as server:
+            print(f"Serving {len(pages)} pages at {server.url}listings/<n>")
+            print("Press Ctrl+C to stop")
+            with contextlib.suppress(KeyboardInterrupt):
+                while True:
+                    time.sleep(3600)
+    else:
+        results = []
+        print(
+            f"{'pages':>8} {'listings':>9} {'rows':>9} "
+            f"{'fetch s':>9} {'parse s':>9} {'clean s':>9}"
+        )
+        for page_count in args.pages:
+            timing = measure(synthetic(page_count), args.workers, **server_options)
+            results.append(timing)
+            print(
+                f"{timing['pages']:>8} {timing['listings']:>9} {timing['rows']:>9} "
+                f"{timing['fetch_s']:>9.2f} {timing['parse_s']:>9.2f} "
+                f"{timing['clean_s']:>9.2f}"
+            )
+            if timing["missing_rows"]:
+                print(
+                    f"Warning: {timing['missing_rows']} of {timing['listings']} "
+                    "listings were not collected, the timings cover fewer rows"
+                )
+        path = args.output or bench_dir / "scaling.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2))
+        print(f"Results saved to {path}")
@@ -0,0 +1,44 @@
+from functools import partial
+from pathlib import Path
+
+import main
+from sessions import SessionPool
+from standin import ERROR_PAGE, StandInServer
+
+external_dir = Path(__file__).parent.parent / "data" / "external"
+
+
+class FailingPageServer(StandInServer):
+    """Stand-in that answers every request for one page with a 503."""
+
+    def __init__(self, pages, failing: int, **options):
+        super().__init__(pages, **options)
+        self.failing = failing
+
+    def respond(self, path, cookies):
+        if path.rstrip("/").endswith(f"/{self.failing}"):
+            return 503, ERROR_PAGE
+        return super().respond(path, cookies)
+
+
+def test_persistent_server_error_skips_the_page(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(main, "STOP_PAGE", float("inf"))
+    main.init()
+    monkeypatch.setattr(
+        main, "session_pool", SessionPool([{}], main.REQUEST_HEADERS, rate=None)
+    )
+    failed_before = main.PAGES_FAILED.value
+    page = (external_dir / "category1.html").read_bytes()
+
+    with FailingPageServer([page] * 3, failing=2, compress=True) as server:
+        pages = main.get_all_category_pages(
+            server.url + "listings/",
+            fetch=partial(main.fetch_data, use_cache=False),
+            page_nums=range(1, 5),
+        )
+
+    assert len(pages) == 2
+    assert main.PAGES_FAILED.value - failed_before == 1
+    assert main.STOP_PAGE == 4
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import main
+from schema import conform_listings, read_listings_csv, validate_listings
+
+external_dir = Path(__file__).parent.parent / "data" / "external"
+
+
+def test_conform_fallback_rows(tmp_path):
+    page = (external_dir / "category1.html").read_bytes()
+    df = conform_listings(main.build_listings_frame(main.parse_category_page(page)))
+    validate_listings(df)
+
+    assert df["price"].iloc[0] == 1_500_000
+    assert df["area_sqm"].iloc[0] == 116
+    assert df["street_width"].dropna().tolist() == [30]
+    assert df["zoning"].dropna().tolist() == ["تجاري"]
+
+    path = tmp_path / "listings.csv"
+    df.to_csv(path, index=False)
+    for engine in ("c", "pyarrow"):
+        assert read_listings_csv(path, engine=engine)["price"].equals(df["price"])
+
+
+def test_conform_drops_non_numeric_text():
+    df = conform_listings(main.pd.DataFrame({"id": [1, 2], "price": ["n/a", "5"]}))
+    assert df["price"].isna().tolist() == [True, False]
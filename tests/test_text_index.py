@@ -0,0 +1,20 @@
+import pandas as pd
+
+from text_index import TextIndex
+
+
+def test_or_binds_tighter_than_and(tmp_path):
+    index = TextIndex(tmp_path / "text.sqlite")
+    index.add(
+        pd.DataFrame(
+            {
+                "id": [1, 2, 3, 4],
+                "title": ["شقة مسبح", "شقة حديقة", "فيلا حديقة", "شقة"],
+            }
+        )
+    )
+    # شقة AND (مسبح OR حديقة), not (شقة AND مسبح) OR حديقة
+    assert index.search("شقة مسبح OR حديقة").tolist() == [1, 2]
+    assert index.search("مسبح OR حديقة").tolist() == [1, 2, 3]
+    assert index.search("شقة مسبح OR حديقة -مسبح").tolist() == [2]
+    index.close()
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import argparse
+import re
+import shlex
+import sqlite3
+import zlib
+from collections import defaultdict
+from functools import reduce
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = lazy_import("numpy")
+    pd = lazy_import("pandas")
+
+default_text_index_path = Path("./data/processed") / "aqar_fm_listings_text.sqlite"
+
+TEXT_FIELDS = ["title", "description", "address", "district"]
+# unused positions between the last word of a field and the first of the
+# next, so phrases never match across two fields
+FIELD_GAP = 1
+# segments merged into one by add() once there are more than this many
+MAX_SEGMENTS = 8
+
+_WORD = re.compile(r"\w+")
+
+
+def terms(text) -> list[str]:
+    """Words of `text` after clean_data's normalization, lowercased."""
+    from clean_data import clean_text
+
+    cleaned = clean_text(text)
+    return _WORD.findall(cleaned.lower()) if cleaned else []
+
+
+def _encode(docs, counts, positions) -> bytes:
+    """Posting list as zlib-compressed, delta-encoded uint32 arrays.
+
+    `docs` are increasing doc numbers, `counts` the occurrences in each and
+    `positions` the word positions of all occurrences, increasing per doc.
+    Layout: doc count, doc number deltas, counts, then the position deltas,
+    which restart at every doc.
+    """
+    docs = np.asarray(docs, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    deltas = np.diff(positions, prepend=0)
+    starts = np.cumsum(counts) - counts
+    deltas[starts] = positions[starts]
+    flat = np.concatenate([[len(docs)], np.diff(docs, prepend=0), counts, deltas])
+    return zlib.compress(flat.astype(np.uint32).tobytes(), 1)
+
+
+def _decode(blob: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """(doc, position) arrays of every occurrence in a posting list."""
+    flat = np.frombuffer(zlib.decompress(blob), dtype=np.uint32).astype(np.int64)
+    n = int(flat[0])
+    docs = np.cumsum(flat[1 : n + 1])
+    counts = flat[n + 1 : 2 * n + 1]
+    deltas = flat[2 * n + 1 :]
+    occurrence_docs = np.repeat(docs, counts)
+    # positions restart at every doc: cumsum, minus the running total at the
+    # doc's first occurrence
+    running = np.cumsum(deltas)
+    starts = np.cumsum(counts) - counts
+    offsets = np.repeat(running[starts] - deltas[starts], counts)
+    return occurrence_docs, running - offsets
+
+
+class TextIndex:
+    """Persistent inverted index over the listings' text fields.
+
+    Text is normalized like the cleaned dataset (clean_data.clean_text) and
+    split into words. Every term has a posting list per segment: doc
+    numbers and word positions, delta-encoded and zlib-compressed. Each
+    add() writes one new segment; a listing added again gets a new doc
+    number and its old one is marked dead, so updates never rewrite the
+    existing postings. Segments are merged (dropping dead docs) once there
+    are more than MAX_SEGMENTS. Queries only read the posting lists of their
+    terms.
+    """
+
+    def __init__(self, path: Path = default_text_index_path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    doc INTEGER PRIMARY KEY,
+                    id INTEGER NOT NULL,
+                    live INTEGER NOT NULL
+                )
+                """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS docs_id ON docs (id)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    segment INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (term, segment)
+                ) WITHOUT ROWID
+                """)
+        self._doc_ids = None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM docs WHERE live").fetchone()[0]
+
+    def _segments(self) -> list[int]:
+        rows = self.conn.execute("SELECT DISTINCT segment FROM postings ORDER BY 1")
+        return [segment for (segment,) in rows]
+
+    def _write_segment(self, postings: dict[str, tuple]) -> None:
+        """Store `term -> (docs, counts, positions)` as a new segment."""
+        segment = max(self._segments(), default=-1) + 1
+        self.conn.executemany(
+            "INSERT INTO postings VALUES (?, ?, ?)",
+            ((term, segment, _encode(*posting)) for term, posting in postings.items()),
+        )
+
+    def add(self, df: pd.DataFrame) -> int:
+        """Index the listings of `df`, replacing earlier versions; returns
+        the number of listings indexed."""
+        ids = pd.to_numeric(df["id"], errors="coerce")
+        df = df[ids.notna()].assign(id=ids[ids.notna()].astype("int64"))
+        df = df.drop_duplicates("id", keep="last")
+        fields = [field for field in TEXT_FIELDS if field in df.columns]
+        first_doc = (
+            self.conn.execute("SELECT MAX(doc) FROM docs").fetchone()[0] or 0
+        ) + 1
+
+        postings: dict[str, tuple] = defaultdict(lambda: ([], [], []))
+        for doc, row in enumerate(
+            df[["id", *fields]].itertuples(index=False, name=None), first_doc
+        ):
+            occurrences = defaultdict(list)
+            start = 0
+            for text in row[1:]:
+                field_terms = terms(text)
+                for position, term in enumerate(field_terms, start):
+                    occurrences[term].append(position)
+                start += len(field_terms) + FIELD_GAP
+            for term, positions in occurrences.items():
+                docs, counts, term_positions = postings[term]
+                docs.append(doc)
+                counts.append(len(positions))
+                term_positions.extend(positions)
+
+        with self.conn:
+            listing_ids = df["id"].tolist()
+            self.conn.executemany(
+                "UPDATE docs SET live = 0 WHERE id = ?", ((i,) for i in listing_ids)
+            )
+            self.conn.executemany(
+                "INSERT INTO docs VALUES (?, ?, 1)",
+                zip(range(first_doc, first_doc + len(df)), listing_ids),
+            )
+            self._write_segment(postings)
+        self._doc_ids = None
+        if len(self._segments()) > MAX_SEGMENTS:
+            self.compact()
+        return len(df)
+
+    def compact(self) -> None:
+        """Merge all segments into one, dropping the postings of dead docs."""
+        live = self._live_ids() >= 0
+        merged = {}
+        for (term,) in self.conn.execute("SELECT DISTINCT term FROM postings"):
+            docs, positions = self._occurrences(term)
+            keep = live[docs]
+            docs, positions = docs[keep], positions[keep]
+            if not len(docs):
+                continue
+            doc_numbers, counts = np.unique(docs, return_counts=True)
+            merged[term] = (doc_numbers, counts, positions)
+        with self.conn:
+            self.conn.execute("DELETE FROM postings")
+            self.conn.execute("DELETE FROM docs WHERE NOT live")
+            self._write_segment(merged)
+        self.conn.execute("VACUUM")
+
+    def _live_ids(self) -> np.ndarray:
+        """Listing id of every doc number, -1 for dead or unused numbers."""
+        if self._doc_ids is None:
+            rows = np.array(
+                self.conn.execute("SELECT doc, id FROM docs WHERE live").fetchall(),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            size = self.conn.execute("SELECT MAX(doc) FROM docs").fetchone()[0] or 0
+            self._doc_ids = np.full(size + 1, -1, dtype=np.int64)
+            self._doc_ids[rows[:, 0]] = rows[:, 1]
+        return self._doc_ids
+
+    def _occurrences(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """(doc, position) of every occurrence of `term`, by doc then position."""
+        parts = [
+            _decode(blob)
+            for (blob,) in self.conn.execute(
+                "SELECT data FROM postings WHERE term = ? ORDER BY segment", (term,)
+            )
+        ]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # segments hold increasing doc numbers, so concatenating keeps order
+        return (
+            np.concatenate([docs for docs, _ in parts]),
+            np.concatenate([positions for _, positions in parts]),
+        )
+
+    def _phrase_docs(self, words: list[str]) -> np.ndarray:
+        """Doc numbers containing the words consecutively (any doc for one)."""
+        if not words:
+            return np.empty(0, dtype=np.int64)
+        matches = None
+        for offset, word in enumerate(words):
+            docs, positions = self._occurrences(word)
+            # (doc, start of the phrase) packed into one int64; a word this
+            # close to the start of its doc cannot be `offset` words in
+            fits = positions >= offset
+            keys = (docs[fits] << 32) | (positions[fits] - offset)
+            matches = keys if matches is None else np.intersect1d(matches, keys)
+            if not len(matches):
+                break
+        return np.unique(matches >> 32)
+
+    def search(self, query: str) -> np.ndarray:
+        """Ids of the listings matching `query`, sorted.
+
+        Words and "quoted phrases" must all match; `OR` between two of them
+        matches either, and binds tighter than the implicit AND, so `a b OR
+        c` matches `a` and either `b` or `c`. A leading `-` excludes
+        listings that match. Words are normalized like the indexed text.
+        """
+        # alternatives of every term that must match, OR-ed within a group
+        groups: list[list[np.ndarray]] = []
+        excluded, pending_or = [], False
+        live = self._live_ids()
+        for token in shlex.split(query):
+            if token == "OR":
+                pending_or = True
+                continue
+            negate = token.startswith("-") and len(token) > 1
+            docs = self._phrase_docs(terms(token[1:] if negate else token))
+            if negate:
+                excluded.append(docs)
+            elif pending_or and groups:
+                groups[-1].append(docs)
+            else:
+                groups.append([docs])
+            pending_or = False
+        if not groups:
+            return np.empty(0, dtype=np.int64)
+        result = None
+        for alternatives in groups:
+            docs = reduce(np.union1d, alternatives)
+            result = docs if result is None else np.intersect1d(result, docs)
+        for docs in excluded:
+            result = np.setdiff1d(result, docs)
+        ids = live[result[result < len(live)]]
+        return np.sort(ids[ids >= 0])
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the listing text index")
+    parser.add_argument("query", help='words, "phrases", OR and -excluded words')
+    parser.add_argument("--index", type=Path, default=default_text_index_path)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    ids = TextIndex(args.index).search(args.query)
+    print(f"{len(ids)} listings match")
+    for listing_id in ids[: args.limit]:
+        print(listing_id)